@@ -0,0 +1,273 @@
+import argparse
+import json
+import multiprocessing as mp
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+import numpy as np
+from backends import resolve_model_path
+from game_logic import LEFT, RIGHT
+from tt_processor import TableTennisProcessor, compute_table_roi, draw_overlay, load_table_corners
+
+# Детектор рабочего процесса (создаётся один раз в _init_worker)
+_detector = None
+
+
+def _init_worker(model_path, conf, iou, threads):
+    global _detector
+    # Без ограничения каждый процесс займёт все ядра под torch/OpenMP.
+    # OMP_NUM_THREADS здесь ставить поздно — numpy и cv2 уже импортированы
+    # (его выставляет run_detection до запуска процессов), поэтому потоки
+    # ограничиваются и явно
+    if threads:
+        cv2.setNumThreads(threads)
+
+    from tt_processor import Detector
+
+    _detector = Detector(model_path, conf, iou)
+    if threads:
+        import torch
+
+        torch.set_num_threads(threads)
+
+
+def chunk_ranges(total, chunk_size):
+    """Разбиение [0, total) на отрезки (start, end) по chunk_size кадров."""
+    return [(start, min(start + chunk_size, total)) for start in range(0, total, chunk_size)]
+
+
+def detect_chunk(video, start, end, batch_size, roi=None):
+    """
+    Детекция на кадрах [start, end) видео в рабочем процессе.
+    Возвращает (start, список массивов [x1, y1, x2, y2, conf, cls] по кадрам).
+    Кадры, которые не удалось прочитать, получают пустой массив.
+
+    Перемотка по кадрам в сжатом видео неточна (ищется ближайший ключевой
+    кадр), поэтому позиция после seek перечитывается: недолёт добирается
+    чтением, кадры перелёта остаются пустыми. Для видео без точного
+    индекса кадров (часть контейнеров и кодеков) и сама позиция может
+    быть неверной — нумерация кадров у границ отрезков приблизительная.
+    """
+    cap = cv2.VideoCapture(video)
+    if not cap.isOpened():
+        raise ValueError(f"Could not open video: {video}")
+    cap.set(cv2.CAP_PROP_POS_FRAMES, start)
+    pos = int(cap.get(cv2.CAP_PROP_POS_FRAMES))
+    while pos < start and cap.grab():
+        pos += 1
+
+    frame_no = min(max(start, pos), end)
+    detections = [np.empty((0, 6), dtype=np.float32)] * (frame_no - start)
+    while frame_no < end:
+        batch = []
+        while len(batch) < batch_size and frame_no + len(batch) < end:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            batch.append(frame)
+        if not batch:
+            break
+        detections.extend(_detector.detect(batch, roi=roi))
+        frame_no += len(batch)
+    cap.release()
+
+    detections += [np.empty((0, 6), dtype=np.float32)] * (end - frame_no)
+    return start, detections
+
+
+def run_detection(video, total, model_path, args, roi=None):
+    """
+    Параллельная детекция по отрезкам видео. Результаты склеиваются
+    по номерам кадров, независимо от порядка завершения отрезков.
+    """
+    chunks = chunk_ranges(total, args.chunk_size)
+    detections = [None] * total
+
+    # Рабочие процессы наследуют окружение: OpenMP/BLAS прочитают лимит
+    # при первом импорте numpy, ещё до _init_worker
+    if args.threads:
+        os.environ["OMP_NUM_THREADS"] = str(args.threads)
+
+    ctx = mp.get_context("spawn")
+    with ProcessPoolExecutor(
+        max_workers=args.workers,
+        mp_context=ctx,
+        initializer=_init_worker,
+        initargs=(model_path, args.conf, args.iou, args.threads),
+    ) as executor:
+        futures = [
+            executor.submit(detect_chunk, video, start, end, args.batch, roi)
+            for start, end in chunks
+        ]
+        for done, future in enumerate(futures, 1):
+            start, chunk = future.result()
+            detections[start : start + len(chunk)] = chunk
+            print(f"Отрезков обработано: {done}/{len(chunks)}", flush=True)
+    return detections
+
+
+def save_detections(path, detections):
+    """Все детекции в одном массиве (N, 7): номер кадра + [x1, y1, x2, y2, conf, cls]."""
+    rows = [
+        np.hstack([np.full((len(d), 1), i, dtype=np.float32), d])
+        for i, d in enumerate(detections)
+        if len(d)
+    ]
+    data = np.vstack(rows) if rows else np.empty((0, 7), dtype=np.float32)
+    np.savez_compressed(path, detections=data, frames=len(detections))
+
+
+def load_detections(path):
+    with np.load(path) as f:
+        data, total = f["detections"], int(f["frames"])
+    index = data[:, 0].astype(int)
+    return [data[index == i, 1:] for i in range(total)]
+
+
+def build_timeline(processor, detections, fps, frames=None, writer=None):
+    """
+    Прогон игровой логики по склеенным детекциям строго по порядку кадров.
+    frames — итератор кадров видео для аннотированного вывода в writer.
+    Возвращает список событий.
+    """
+    timeline = []
+    frame_no = 0
+
+    def on_event(event, side, winner):
+        entry = {
+            "frame": frame_no,
+            "time": round(frame_no / fps, 3),
+            "event": event,
+            "side": side,
+            "rally": processor.rally.state.name,
+        }
+        if winner:
+            game = processor.current_game
+            entry["point"] = winner
+            entry["score"] = [game.score[LEFT], game.score[RIGHT]]
+            if game.finished:
+                games = dict(processor.match.games_won)
+                games[winner] += 1
+                entry["games"] = [games[LEFT], games[RIGHT]]
+        timeline.append(entry)
+
+    processor.on_event = on_event
+    for frame_no, dets in enumerate(detections):
+        overlay = processor.update(dets, frame_no / fps)
+        if writer is None:
+            continue
+        frame = next(frames, None)
+        if frame is not None:
+            draw_overlay(frame, overlay, processor.src_corners)
+            writer.write(frame)
+    return timeline
+
+
+def read_frames(cap):
+    while True:
+        ret, frame = cap.read()
+        if not ret:
+            return
+        yield frame
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Офлайн-анализ записанного матча: параллельная детекция по отрезкам, "
+        "затем подсчёт розыгрышей и счёта"
+    )
+    parser.add_argument("--video", required=True, help="Путь к видеофайлу")
+    parser.add_argument("--corners", default="table_corners.json")
+    parser.add_argument("--model", default="model/ppv_yolo11s_based.pt")
+    parser.add_argument("--backend", default="torch", choices=["torch", "onnx", "openvino"])
+    parser.add_argument("--int8", action="store_true")
+    parser.add_argument("--conf", type=float, default=0.2)
+    parser.add_argument("--iou", type=float, default=0.7)
+    parser.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 2) // 2))
+    parser.add_argument(
+        "--threads", type=int, default=2, help="Потоков на процесс (0 — без ограничения)"
+    )
+    parser.add_argument("--chunk-size", type=int, default=1500, help="Кадров в отрезке")
+    parser.add_argument("--batch", type=int, default=8, help="Кадров на вызов модели")
+    parser.add_argument("--roi", action="store_true", help="Детекция в области стола")
+    parser.add_argument(
+        "--table-lut", action="store_true", help="Таблица пиксель -> стол рядом с --corners"
+    )
+    parser.add_argument(
+        "--detections",
+        help="Файл .npz с детекциями: если существует — инференс пропускается, иначе сохраняется",
+    )
+    parser.add_argument("--out", default="timeline.json", help="JSON с таймлайном событий")
+    parser.add_argument("--annotate", help="Записать видео с разметкой (mp4)")
+    args = parser.parse_args()
+
+    cap = cv2.VideoCapture(args.video)
+    if not cap.isOpened():
+        raise ValueError(f"Could not open video: {args.video}")
+    width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+    height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    fps = cap.get(cv2.CAP_PROP_FPS) or 30
+    total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    cap.release()
+
+    src_corners = load_table_corners(args.corners)
+    roi = compute_table_roi(src_corners) if args.roi else None
+
+    start = time.perf_counter()
+    if args.detections and os.path.exists(args.detections):
+        detections = load_detections(args.detections)
+    else:
+        model_path = resolve_model_path(args.model, args.backend, args.int8)
+        detections = run_detection(args.video, total, model_path, args, roi)
+        if args.detections:
+            save_detections(args.detections, detections)
+    detect_seconds = time.perf_counter() - start
+
+    processor = TableTennisProcessor(
+        model_path=None,
+        corners_json=args.corners,
+        table_lut=args.table_lut,
+        frame_size=(width, height),
+    )
+    writer = frames = None
+    if args.annotate:
+        cap = cv2.VideoCapture(args.video)
+        frames = read_frames(cap)
+        writer = cv2.VideoWriter(
+            args.annotate, cv2.VideoWriter_fourcc(*"mp4v"), fps, (width, height)
+        )
+
+    timeline = build_timeline(processor, detections, fps, frames, writer)
+    if writer is not None:
+        writer.release()
+        cap.release()
+    wall = time.perf_counter() - start
+
+    report = {
+        "video": args.video,
+        "frames": len(detections),
+        "fps": fps,
+        "duration_seconds": len(detections) / fps,
+        "detect_seconds": detect_seconds,
+        "wall_seconds": wall,
+        "realtime_factor": len(detections) / fps / wall if wall else 0.0,
+        "score": [processor.current_game.score[LEFT], processor.current_game.score[RIGHT]],
+        "games": [processor.match.games_won[LEFT], processor.match.games_won[RIGHT]],
+        "points": sum(1 for e in timeline if "point" in e),
+        "events": timeline,
+    }
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+
+    print(
+        f"{report['frames']} кадров за {wall:.1f} с "
+        f"(x{report['realtime_factor']:.1f} от реального времени), "
+        f"очков: {report['points']}, сеты {report['games'][0]}:{report['games'][1]}, "
+        f"счёт {report['score'][0]}:{report['score'][1]}"
+    )
+
+
+if __name__ == "__main__":
+    main()
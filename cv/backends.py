@@ -0,0 +1,131 @@
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+BACKEND_TORCH = "torch"
+BACKEND_ONNX = "onnx"
+BACKEND_OPENVINO = "openvino"
+
+BACKENDS = (BACKEND_TORCH, BACKEND_ONNX, BACKEND_OPENVINO)
+
+
+def exported_model_path(model_path, backend=BACKEND_TORCH, int8=False):
+    """
+    Путь к экспортированной модели рядом с исходным .pt
+    (имена совпадают с тем, что создаёт export_model.py / ultralytics export).
+    """
+    p = Path(model_path)
+    suffix = "_int8" if int8 else ""
+
+    if backend == BACKEND_TORCH:
+        if int8:
+            raise ValueError("INT8 is only available for onnx and openvino backends")
+        return str(p)
+    if backend == BACKEND_ONNX:
+        return str(p.with_name(f"{p.stem}{suffix}.onnx"))
+    if backend == BACKEND_OPENVINO:
+        return str(p.with_name(f"{p.stem}{suffix}_openvino_model"))
+
+    raise ValueError(f"Unknown model backend: {backend}, expected one of {BACKENDS}")
+
+
+def resolve_model_path(model_path, backend=BACKEND_TORCH, int8=False):
+    path = exported_model_path(model_path, backend, int8)
+    if backend != BACKEND_TORCH and not Path(path).exists():
+        raise FileNotFoundError(
+            f"Model for backend {backend} not found: {path}. "
+            f"Export it first: python export_model.py --model {model_path} --format {backend}"
+            + (" --int8 --calib-video <video>" if int8 else "")
+        )
+    return path
+
+
+def letterbox(frame, size=640, color=(114, 114, 114)):
+    """
+    Масштабирование с сохранением пропорций и паддингом до size x size,
+    как в препроцессинге ultralytics. Возвращает (img, scale, (pad_x, pad_y)).
+    """
+    h, w = frame.shape[:2]
+    scale = min(size / h, size / w)
+    nh, nw = round(h * scale), round(w * scale)
+    pad_x, pad_y = (size - nw) // 2, (size - nh) // 2
+
+    img = np.full((size, size, 3), color, dtype=np.uint8)
+    img[pad_y : pad_y + nh, pad_x : pad_x + nw] = cv2.resize(
+        frame, (nw, nh), interpolation=cv2.INTER_LINEAR
+    )
+    return img, scale, (pad_x, pad_y)
+
+
+def sample_frames(video_path, count):
+    """Равномерно выбирает count кадров из видео."""
+    cap = cv2.VideoCapture(str(video_path))
+    if not cap.isOpened():
+        raise ValueError(f"Could not open video: {video_path}")
+
+    total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    positions = np.linspace(0, max(total - 1, 0), num=min(count, max(total, 1)), dtype=int)
+
+    frames = []
+    for pos in positions:
+        cap.set(cv2.CAP_PROP_POS_FRAMES, int(pos))
+        ret, frame = cap.read()
+        if ret:
+            frames.append(frame)
+    cap.release()
+    return frames
+
+
+def box_iou(a, b):
+    """Попарный IoU боксов [x1, y1, x2, y2]: (N, 4) x (M, 4) -> (N, M)."""
+    x1 = np.maximum(a[:, None, 0], b[None, :, 0])
+    y1 = np.maximum(a[:, None, 1], b[None, :, 1])
+    x2 = np.minimum(a[:, None, 2], b[None, :, 2])
+    y2 = np.minimum(a[:, None, 3], b[None, :, 3])
+    inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    return inter / (area_a[:, None] + area_b[None, :] - inter + 1e-9)
+
+
+def compare_detections(reference, candidate, iou_threshold=0.5):
+    """
+    Сравнивает детекции двух моделей по кадрам ([x1, y1, x2, y2, conf, cls]).
+    Боксы сопоставляются жадно по IoU внутри одного класса.
+    """
+    matched = 0
+    ref_total = 0
+    cand_total = 0
+    ious = []
+    conf_diffs = []
+
+    for ref, cand in zip(reference, candidate):
+        ref_total += len(ref)
+        cand_total += len(cand)
+        if len(ref) == 0 or len(cand) == 0:
+            continue
+
+        iou = box_iou(ref[:, :4], cand[:, :4])
+        iou[ref[:, None, 5] != cand[None, :, 5]] = 0
+
+        while True:
+            i, j = np.unravel_index(np.argmax(iou), iou.shape)
+            if iou[i, j] < iou_threshold:
+                break
+            matched += 1
+            ious.append(float(iou[i, j]))
+            conf_diffs.append(abs(float(ref[i, 4] - cand[j, 4])))
+            iou[i, :] = 0
+            iou[:, j] = 0
+
+    return {
+        "frames": len(reference),
+        "reference_boxes": ref_total,
+        "candidate_boxes": cand_total,
+        "matched": matched,
+        "recall": matched / ref_total if ref_total else 1.0,
+        "precision": matched / cand_total if cand_total else 1.0,
+        "mean_iou": float(np.mean(ious)) if ious else 0.0,
+        "max_conf_diff": float(np.max(conf_diffs)) if conf_diffs else 0.0,
+    }
@@ -0,0 +1,82 @@
+import argparse
+import json
+import time
+
+import numpy as np
+from game_logic import (
+    MID_X,
+    TABLE_H,
+    TABLE_W,
+    BallState,
+    detect_bounce,
+    detect_event,
+    detect_hit,
+    detect_net,
+)
+
+
+def synthetic_track(frames, seed=0):
+    """
+    Траектория мяча в координатах стола: полёт над столом с отражением
+    от краёв, случайной сменой направления по X (удары) и шумом детекции.
+    """
+    rng = np.random.default_rng(seed)
+    points = np.empty((frames, 2))
+    x, y = TABLE_W / 4, TABLE_H / 2
+    vx, vy = 40.0, 15.0
+    for i in range(frames):
+        if rng.random() < 0.03:
+            vx = -vx
+        if not 0 < x + vx < TABLE_W:
+            vx = -vx
+        if not 0 < y + vy < TABLE_H:
+            vy = -vy
+        x += vx
+        y += vy
+        points[i] = x + rng.normal(0, 2), y + rng.normal(0, 2)
+    return points.astype(int).tolist()
+
+
+def bench(fn, points, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        ball_state = BallState()
+        start = time.perf_counter()
+        for x, y in points:
+            fn(ball_state, x, y)
+        best = min(best, time.perf_counter() - start)
+    return best / len(points) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Микробенчмарк игровой логики (мкс на кадр)")
+    parser.add_argument("--frames", type=int, default=20000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    points = synthetic_track(args.frames)
+
+    def update(ball_state, x, y):
+        ball_state.update(x, y)
+
+    def step(ball_state, x, y):
+        ball_state.update(x, y)
+        detect_event(ball_state, x, y)
+
+    def detectors(ball_state, x, y):
+        ball_state.update(x, y)
+        detect_bounce(ball_state)
+        detect_hit(ball_state)
+        detect_net(ball_state, MID_X)
+
+    report = {
+        "frames": args.frames,
+        "update_us": bench(update, points, args.repeat),
+        "all_detectors_us": bench(detectors, points, args.repeat),
+        "detect_event_us": bench(step, points, args.repeat),
+    }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,254 @@
+import argparse
+import json
+import resource
+import shutil
+import subprocess
+import sys
+import time
+
+import cv2
+import numpy as np
+from backends import resolve_model_path
+from tt_processor import TableTennisProcessor
+from yuv import PIX_FMTS, from_bgr
+
+STAGES = ("decode", "inference", "logic", "draw", "encode")
+
+
+class StageRecorder:
+    """
+    Собирает длительности стадий (секунды на кадр); подключается
+    к TableTennisProcessor.on_timing.
+    """
+
+    def __init__(self):
+        self.samples = {stage: [] for stage in STAGES}
+
+    def __call__(self, stage, seconds, frames=1):
+        self.samples.setdefault(stage, []).extend([seconds] * frames)
+
+    def summary(self):
+        out = {}
+        for stage, values in self.samples.items():
+            if not values:
+                continue
+            ms = np.array(values) * 1000
+            out[stage] = {
+                "count": len(values),
+                "mean_ms": float(ms.mean()),
+                "p50_ms": float(np.percentile(ms, 50)),
+                "p90_ms": float(np.percentile(ms, 90)),
+                "p99_ms": float(np.percentile(ms, 99)),
+                "max_ms": float(ms.max()),
+            }
+        return out
+
+
+def open_encoder(width, height, fps, pix_fmt="bgr24"):
+    """
+    ffmpeg с теми же параметрами кодирования, что в RTSPWriter, но в никуда.
+    """
+    if shutil.which("ffmpeg") is None:
+        return None
+    cmd = [
+        "ffmpeg",
+        "-loglevel",
+        "error",
+        "-f",
+        "rawvideo",
+        "-pix_fmt",
+        pix_fmt,
+        "-s",
+        f"{width}x{height}",
+        "-r",
+        str(fps),
+        "-i",
+        "-",
+        "-c:v",
+        "libx264",
+        "-pix_fmt",
+        "yuv420p",
+        "-preset",
+        "ultrafast",
+        "-f",
+        "null",
+        "-",
+    ]
+    return subprocess.Popen(cmd, stdin=subprocess.PIPE)
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(args):
+    cap = cv2.VideoCapture(args.video)
+    if not cap.isOpened():
+        raise ValueError(f"Could not open video: {args.video}")
+    width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+    height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    fps = cap.get(cv2.CAP_PROP_FPS) or 30
+
+    processor = TableTennisProcessor(
+        model_path=resolve_model_path(args.model, args.backend, args.int8),
+        corners_json=args.corners,
+        top_view_scale=args.top_view_scale,
+        roi=args.roi,
+        track=args.track,
+        pix_fmt=args.pix_fmt,
+        lean=args.lean,
+        infer_threads=args.threads,
+    )
+    recorder = StageRecorder()
+    encoder = None if args.no_encode else open_encoder(width, height, round(fps), args.pix_fmt)
+
+    frames_done = 0
+    start = None
+    # С какого кадра идёт замер: прогрев заканчивается на границе батча,
+    # поэтому может занять больше args.warmup кадров
+    measured_from = None
+    while args.frames == 0 or start is None or frames_done - measured_from < args.frames:
+        # Прогрев модели не входит в статистику
+        if start is None and frames_done >= args.warmup:
+            processor.on_timing = recorder
+            start = time.perf_counter()
+            measured_from = frames_done
+        measuring = processor.on_timing is not None
+
+        batch, infer_frames = [], []
+        for _ in range(args.batch):
+            t0 = time.perf_counter()
+            ret, frame = cap.read()
+            if not ret:
+                break
+            if measuring:
+                recorder("decode", time.perf_counter() - t0)
+            # В сервисе кадр сразу приходит от ffmpeg в нужном формате и размере,
+            # поэтому перевод из BGR OpenCV и уменьшение в замер decode не входят
+            batch.append(from_bgr(frame, args.pix_fmt))
+            if args.infer_size:
+                infer_frames.append(cv2.resize(frame, args.infer_size, interpolation=cv2.INTER_AREA))
+        if not batch:
+            break
+
+        timestamps = [(frames_done + i) / fps for i in range(len(batch))]
+        processor.process_batch(
+            batch,
+            copy=False,
+            top_view=args.top_view,
+            timestamps=timestamps,
+            infer_frames=infer_frames or None,
+        )
+
+        if encoder is not None:
+            for frame in batch:
+                t0 = time.perf_counter()
+                encoder.stdin.write(frame.data)
+                if measuring:
+                    recorder("encode", time.perf_counter() - t0)
+        frames_done += len(batch)
+
+    wall = time.perf_counter() - start if start is not None else 0.0
+    cap.release()
+    if encoder is not None:
+        encoder.stdin.close()
+        encoder.wait()
+
+    measured = frames_done - measured_from if start is not None else 0
+    return {
+        "commit": git_commit(),
+        "video": args.video,
+        "resolution": [width, height],
+        "frames": measured,
+        "wall_seconds": wall,
+        "fps": measured / wall if wall else 0.0,
+        # ru_maxrss в Linux — в килобайтах
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "config": {
+            "model": args.model,
+            "backend": args.backend,
+            "int8": args.int8,
+            "lean": args.lean,
+            "threads": args.threads,
+            "batch": args.batch,
+            "roi": args.roi,
+            "track": args.track,
+            "top_view": args.top_view,
+            "pix_fmt": args.pix_fmt,
+            "infer_size": args.infer_size,
+            "encode": encoder is not None,
+        },
+        "stages": recorder.summary(),
+        "tracker": dict(processor.tracker.counters),
+    }
+
+
+def compare(report, baseline, tolerance):
+    """
+    Регрессии относительно сохранённого отчёта: падение fps или рост
+    медианы стадии больше чем на tolerance (доля).
+    """
+    regressions = []
+    if report["fps"] < baseline["fps"] * (1 - tolerance):
+        regressions.append(f"fps {baseline['fps']:.1f} -> {report['fps']:.1f}")
+
+    for stage, stats in report["stages"].items():
+        base = baseline.get("stages", {}).get(stage)
+        if base and stats["p50_ms"] > base["p50_ms"] * (1 + tolerance):
+            regressions.append(f"{stage} p50 {base['p50_ms']:.2f}ms -> {stats['p50_ms']:.2f}ms")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Бенчмарк CV-конвейера на записанном видео (без окон и RTSP)"
+    )
+    parser.add_argument("--video", required=True, help="Путь к видеофайлу")
+    parser.add_argument("--corners", default="table_corners.json")
+    parser.add_argument("--model", default="model/ppv_yolo11s_based.pt")
+    parser.add_argument("--backend", default="torch", choices=["torch", "onnx", "openvino"])
+    parser.add_argument("--int8", action="store_true")
+    parser.add_argument("--lean", action="store_true", help="Инференс без предиктора ultralytics")
+    parser.add_argument("--threads", type=int, default=0, help="Потоки torch на CPU (0 — как есть)")
+    parser.add_argument("--batch", type=int, default=1)
+    parser.add_argument("--frames", type=int, default=0, help="Сколько кадров (0 — всё видео)")
+    parser.add_argument("--warmup", type=int, default=10, help="Кадры прогрева вне статистики")
+    parser.add_argument("--roi", action="store_true", help="Детекция в области стола")
+    parser.add_argument("--track", action="store_true", help="Детекция в окне вокруг мяча")
+    parser.add_argument("--top-view", action="store_true", help="Рисовать вид сверху")
+    parser.add_argument("--pix-fmt", default="bgr24", choices=PIX_FMTS, help="Формат кадров")
+    parser.add_argument(
+        "--infer-size",
+        type=lambda s: tuple(int(v) for v in s.split("x")),
+        help="WxH кадра для детектора (как INFER_WIDTH/INFER_HEIGHT)",
+    )
+    parser.add_argument("--top-view-scale", type=float, default=0.25)
+    parser.add_argument("--no-encode", action="store_true", help="Без кодирования libx264")
+    parser.add_argument("--out", help="Сохранить отчёт в JSON")
+    parser.add_argument("--baseline", help="JSON-отчёт для сравнения")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="Допустимое ухудшение")
+    args = parser.parse_args()
+
+    report = run(args)
+    print(json.dumps(report, indent=2))
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.tolerance)
+        for r in regressions:
+            print(f"REGRESSION: {r}")
+        sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
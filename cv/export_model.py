@@ -0,0 +1,212 @@
+import argparse
+import json
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import cv2
+import numpy as np
+from backends import (
+    BACKEND_ONNX,
+    BACKEND_OPENVINO,
+    BACKEND_TORCH,
+    BACKENDS,
+    compare_detections,
+    exported_model_path,
+    letterbox,
+    resolve_model_path,
+    sample_frames,
+)
+
+
+def write_calibration_dataset(frames, out_dir, names):
+    """
+    Датасет для калибровки INT8 в формате ultralytics: только изображения, без разметки.
+    """
+    out_dir = Path(out_dir)
+    images = out_dir / "images"
+    images.mkdir(parents=True, exist_ok=True)
+    for i, frame in enumerate(frames):
+        cv2.imwrite(str(images / f"{i:05d}.jpg"), frame)
+
+    data_yaml = out_dir / "data.yaml"
+    lines = [f"path: {out_dir.resolve()}", "train: images", "val: images", f"nc: {len(names)}"]
+    lines.append("names:")
+    lines += [f"- {names[i]}" for i in sorted(names)]
+    data_yaml.write_text("\n".join(lines) + "\n", encoding="utf-8")
+    return str(data_yaml)
+
+
+class FrameCalibrationReader:
+    """
+    Источник калибровочных кадров для onnxruntime.quantization.quantize_static
+    (тот же препроцессинг, что у ultralytics: letterbox, RGB, CHW, 0..1).
+    """
+
+    def __init__(self, frames, input_name, imgsz):
+        self.frames = iter(frames)
+        self.input_name = input_name
+        self.imgsz = imgsz
+
+    def get_next(self):
+        frame = next(self.frames, None)
+        if frame is None:
+            return None
+        img, _, _ = letterbox(frame, self.imgsz)
+        blob = img[:, :, ::-1].transpose(2, 0, 1)[None].astype(np.float32) / 255.0
+        return {self.input_name: np.ascontiguousarray(blob)}
+
+
+def quantize_onnx(src, dst, frames, imgsz):
+    import onnxruntime as ort
+    from onnxruntime.quantization import QuantFormat, QuantType, quantize_static
+
+    session = ort.InferenceSession(src, providers=["CPUExecutionProvider"])
+    input_name = session.get_inputs()[0].name
+    del session
+
+    quantize_static(
+        src,
+        dst,
+        FrameCalibrationReader(frames, input_name, imgsz),
+        quant_format=QuantFormat.QDQ,
+        activation_type=QuantType.QUInt8,
+        weight_type=QuantType.QInt8,
+        per_channel=True,
+    )
+    return dst
+
+
+def export(model_path, fmt, int8=False, calib_video=None, calib_frames=300, imgsz=640):
+    from ultralytics.models import YOLO
+
+    model = YOLO(model_path)
+    frames = []
+    if int8:
+        if calib_video is None:
+            raise ValueError("INT8 export needs --calib-video with recorded frames")
+        frames = sample_frames(calib_video, calib_frames)
+        print(f"Калибровочных кадров: {len(frames)}")
+
+    if fmt == BACKEND_ONNX:
+        path = model.export(format="onnx", imgsz=imgsz, dynamic=True, simplify=True)
+        if int8:
+            path = quantize_onnx(
+                path, exported_model_path(model_path, BACKEND_ONNX, int8=True), frames, imgsz
+            )
+        return path
+
+    if fmt == BACKEND_OPENVINO:
+        if not int8:
+            return model.export(format="openvino", imgsz=imgsz)
+        with tempfile.TemporaryDirectory() as tmp:
+            data = write_calibration_dataset(frames, tmp, model.names)
+            return model.export(format="openvino", imgsz=imgsz, int8=True, data=data)
+
+    raise ValueError(f"Unsupported export format: {fmt}")
+
+
+def check_parity(
+    model_path,
+    backend,
+    video,
+    int8=False,
+    frames_count=200,
+    conf=0.2,
+    iou=0.7,
+    min_match=0.95,
+    min_iou=0.9,
+    lean=False,
+):
+    """
+    Сравнивает детекции экспортированной модели с исходной PyTorch-моделью
+    на кадрах записанного видео. Возвращает (ok, report).
+    lean=True — кандидат через LeanDetector (backend=torch — та же .pt модель).
+    """
+    from tt_processor import Detector, make_detector
+
+    frames = sample_frames(video, frames_count)
+    reference = Detector(model_path, conf, iou)
+    candidate = make_detector(resolve_model_path(model_path, backend, int8), conf, iou, lean)
+
+    def run(detector):
+        detections = []
+        start = time.perf_counter()
+        for frame in frames:
+            detections.extend(detector.detect([frame]))
+        return detections, (time.perf_counter() - start) * 1000 / max(len(frames), 1)
+
+    ref_dets, ref_ms = run(reference)
+    cand_dets, cand_ms = run(candidate)
+
+    report = compare_detections(ref_dets, cand_dets)
+    report.update(
+        backend=backend,
+        int8=int8,
+        lean=lean,
+        reference_ms_per_frame=ref_ms,
+        candidate_ms_per_frame=cand_ms,
+    )
+    ok = (
+        report["recall"] >= min_match
+        and report["precision"] >= min_match
+        and (report["matched"] == 0 or report["mean_iou"] >= min_iou)
+    )
+    return ok, report
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Экспорт модели в ONNX/OpenVINO (опционально INT8) и проверка паритета"
+    )
+    parser.add_argument("--model", default="model/ppv_yolo11s_based.pt", help="Исходная .pt модель")
+    parser.add_argument(
+        "--format",
+        choices=BACKENDS,
+        required=True,
+        help="torch — только с --check --lean: сравнение LeanDetector с предиктором ultralytics",
+    )
+    parser.add_argument("--int8", action="store_true", help="INT8-квантизация")
+    parser.add_argument("--calib-video", help="Видео для калибровки INT8")
+    parser.add_argument("--calib-frames", type=int, default=300)
+    parser.add_argument("--imgsz", type=int, default=640)
+    parser.add_argument(
+        "--check", metavar="VIDEO", help="Не экспортировать, а сравнить детекции с .pt на видео"
+    )
+    parser.add_argument("--lean", action="store_true", help="Проверять через LeanDetector")
+    parser.add_argument("--check-frames", type=int, default=200)
+    parser.add_argument("--min-match", type=float, default=0.95, help="Мин. recall/precision")
+    parser.add_argument("--min-iou", type=float, default=0.9, help="Мин. средний IoU")
+    args = parser.parse_args()
+
+    if args.check:
+        ok, report = check_parity(
+            args.model,
+            args.format,
+            args.check,
+            int8=args.int8,
+            frames_count=args.check_frames,
+            min_match=args.min_match,
+            min_iou=args.min_iou,
+            lean=args.lean,
+        )
+        print(json.dumps(report, indent=2))
+        print("Паритет OK" if ok else "Паритет НЕ пройден")
+        sys.exit(0 if ok else 1)
+
+    if args.format == BACKEND_TORCH:
+        parser.error("--format torch only makes sense with --check --lean")
+    path = export(
+        args.model,
+        args.format,
+        int8=args.int8,
+        calib_video=args.calib_video,
+        calib_frames=args.calib_frames,
+        imgsz=args.imgsz,
+    )
+    print(f"Модель экспортирована: {path}")
+
+
+if __name__ == "__main__":
+    main()
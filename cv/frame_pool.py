@@ -0,0 +1,192 @@
+import logging
+import multiprocessing as mp
+import queue
+from multiprocessing import shared_memory
+
+import numpy as np
+from yuv import PIX_FMT_BGR, frame_shape
+
+log = logging.getLogger("frame_pool")
+
+POLICY_BLOCK = "block"
+POLICY_DROP = "drop"
+
+
+class FramePool:
+    """
+    Фиксированный пул заранее выделенных кадров.
+
+    Кадры передаются между потоками по индексу слота, буферы не копируются
+    и не выделяются заново. Слот возвращается в пул через release().
+
+    shared=True — буферы лежат в SharedMemory, а список свободных слотов
+    в multiprocessing.Queue, так что пул можно передать в дочерний процесс
+    (аргументом Process) и работать с теми же слотами по индексу.
+
+    pix_fmt — формат кадров от ffmpeg: в yuv420p/nv12 слот вдвое меньше bgr24
+    и имеет форму (h * 3 / 2, w), см. yuv.frame_shape.
+
+    infer_size=(w, h) — у каждого слота второй, уменьшенный BGR-кадр для
+    детектора (его отдаёт тот же ffmpeg, см. RTSPReader), доступен через view_infer().
+    """
+
+    def __init__(
+        self,
+        width,
+        height,
+        slots,
+        channels=3,
+        max_bytes=None,
+        shared=False,
+        mp_context=None,
+        pix_fmt=PIX_FMT_BGR,
+        infer_size=None,
+    ):
+        self.width = width
+        self.height = height
+        self.channels = channels
+        self.pix_fmt = pix_fmt
+        if pix_fmt == PIX_FMT_BGR:
+            self.frame_shape = (height, width, channels)
+        else:
+            self.frame_shape = frame_shape(width, height, pix_fmt)
+        self.frame_bytes = int(np.prod(self.frame_shape))
+        self.infer_shape = None
+        self.infer_bytes = 0
+        if infer_size is not None:
+            self.infer_shape = (infer_size[1], infer_size[0], 3)
+            self.infer_bytes = int(np.prod(self.infer_shape))
+        slot_bytes = self.frame_bytes + self.infer_bytes
+
+        if max_bytes is not None:
+            slots = min(slots, max_bytes // slot_bytes)
+        if slots < 1:
+            raise ValueError(
+                f"Frame pool budget {max_bytes} bytes is too small for one "
+                f"{width}x{height} {pix_fmt} frame"
+            )
+
+        self.slots = slots
+        self.shared = shared
+        self._shm = None
+        self._owner = True
+        shape = (slots, *self.frame_shape)
+
+        if shared:
+            ctx = mp_context or mp.get_context()
+            # В том же блоке SharedMemory после кадров — время захвата каждого слота,
+            # затем кадры для детектора
+            self._shm = shared_memory.SharedMemory(create=True, size=slots * (slot_bytes + 8))
+            self._map_shared()
+            self._free = ctx.Queue(maxsize=slots)
+        else:
+            self.buffers = np.empty(shape, dtype=np.uint8)
+            self.timestamps = np.zeros(slots, dtype=np.float64)
+            self.infer_buffers = None
+            if self.infer_shape is not None:
+                self.infer_buffers = np.empty((slots, *self.infer_shape), dtype=np.uint8)
+            self._free = queue.Queue(maxsize=slots)
+
+        for i in range(slots):
+            self._free.put(i)
+
+        log.info(f"Frame pool: {slots} slots, {slots * slot_bytes / (1024 * 1024):.1f} MB")
+
+    def __getstate__(self):
+        if not self.shared:
+            raise TypeError("Only shared FramePool can be passed to another process")
+        state = self.__dict__.copy()
+        state["_shm"] = self._shm.name
+        del state["buffers"]
+        del state["timestamps"]
+        del state["infer_buffers"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._shm = shared_memory.SharedMemory(name=state["_shm"])
+        self._owner = False
+        self._map_shared()
+
+    def _map_shared(self):
+        frames_size = self.slots * self.frame_bytes
+        self.buffers = np.ndarray(
+            (self.slots, *self.frame_shape),
+            dtype=np.uint8,
+            buffer=self._shm.buf,
+        )
+        self.timestamps = np.ndarray(
+            (self.slots,), dtype=np.float64, buffer=self._shm.buf, offset=frames_size
+        )
+        self.infer_buffers = None
+        if self.infer_shape is not None:
+            self.infer_buffers = np.ndarray(
+                (self.slots, *self.infer_shape),
+                dtype=np.uint8,
+                buffer=self._shm.buf,
+                offset=frames_size + self.slots * 8,
+            )
+
+    def close(self):
+        if self._shm is None:
+            return
+        # ndarray держит ссылку на буфер SharedMemory — отпускаем её до close()
+        self.buffers = None
+        self.timestamps = None
+        self.infer_buffers = None
+        self._shm.close()
+        if self._owner:
+            self._shm.unlink()
+        self._shm = None
+
+    @property
+    def nbytes(self):
+        if self.infer_buffers is None:
+            return self.buffers.nbytes
+        return self.buffers.nbytes + self.infer_buffers.nbytes
+
+    def acquire(self, block=True, timeout=None):
+        """Возвращает индекс свободного слота или None, если свободных нет."""
+        try:
+            return self._free.get(block=block, timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def release(self, idx):
+        self._free.put_nowait(idx)
+
+    def view(self, idx):
+        return self.buffers[idx]
+
+    def view_infer(self, idx):
+        """Уменьшенный кадр слота для детектора (только при infer_size)."""
+        return self.infer_buffers[idx]
+
+    def stamp(self, idx, ts):
+        """Запоминает время захвата кадра в слоте (time.monotonic())."""
+        self.timestamps[idx] = ts
+
+    def timestamp(self, idx):
+        return float(self.timestamps[idx])
+
+    def free_slots(self):
+        try:
+            return self._free.qsize()
+        except NotImplementedError:
+            # multiprocessing.Queue.qsize() не реализован на macOS
+            return -1
+
+
+def read_exact_into(stream, buf):
+    """
+    Заполняет buf из потока целиком. Возвращает False при EOF или обрыве кадра.
+    """
+    mv = memoryview(buf).cast("B")
+    total = len(mv)
+    filled = 0
+    while filled < total:
+        n = stream.readinto(mv[filled:])
+        if not n:
+            return False
+        filled += n
+    return True
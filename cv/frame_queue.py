@@ -0,0 +1,103 @@
+import logging
+import queue
+import threading
+import time
+from collections import deque
+
+log = logging.getLogger("frame_queue")
+
+QUEUE_DROP_NEWEST = "drop_newest"
+QUEUE_DROP_OLDEST = "drop_oldest"
+
+EVICT_FULL = "full"  # очередь переполнена — вытеснен самый старый кадр
+EVICT_STALE = "stale"  # кадр старше max_age
+
+
+class LatencyBoundedQueue:
+    """
+    Очередь для live-режима: при переполнении вытесняет самый старый кадр,
+    а при выдаче отбрасывает кадры старше max_age секунд.
+
+    Интерфейс совместим с queue.Queue (put/get/put_nowait/get_nowait/qsize),
+    put никогда не бросает queue.Full. timestamp(item) — время захвата
+    элемента (по умолчанию — время put); on_evict(item) вызывается для каждого
+    вытесненного элемента, например чтобы вернуть слот в FramePool.
+    None (сигнал остановки) не вытесняется и не устаревает.
+    """
+
+    def __init__(self, maxsize, max_age=None, timestamp=None, on_evict=None, name="queue"):
+        self.maxsize = maxsize
+        self.max_age = max_age
+        self.timestamp = timestamp
+        self.on_evict = on_evict
+        self.name = name
+
+        self.evicted = {EVICT_FULL: 0, EVICT_STALE: 0}
+        self._items = deque()
+        self._cond = threading.Condition()
+
+    def qsize(self):
+        with self._cond:
+            return len(self._items)
+
+    def put(self, item, block=True, timeout=None):
+        evicted = None
+        with self._cond:
+            if len(self._items) >= self.maxsize:
+                evicted = self._evict_oldest()
+            ts = time.monotonic() if self.timestamp is None or item is None else None
+            self._items.append((item, ts))
+            self._cond.notify()
+
+        if evicted is not None:
+            self._evicted(evicted, EVICT_FULL)
+
+    def put_nowait(self, item):
+        self.put(item, block=False)
+
+    def get(self, block=True, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        max_age = float("inf") if self.max_age is None else self.max_age
+        stale = []
+        try:
+            with self._cond:
+                while True:
+                    while self._items:
+                        item, ts = self._items.popleft()
+                        if item is not None and self._age(item, ts) > max_age:
+                            stale.append(item)
+                            continue
+                        return item
+
+                    if not block:
+                        raise queue.Empty
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        raise queue.Empty
+                    self._cond.wait(remaining)
+        finally:
+            # Колбэки — уже без блокировки
+            for old in stale:
+                self._evicted(old, EVICT_STALE)
+
+    def get_nowait(self):
+        return self.get(block=False)
+
+    def _age(self, item, ts):
+        if ts is None:
+            ts = self.timestamp(item)
+        return time.monotonic() - ts
+
+    def _evict_oldest(self):
+        # Сигнал остановки не трогаем — вытесняем самый старый кадр после него
+        for i, (item, _) in enumerate(self._items):
+            if item is not None:
+                del self._items[i]
+                return item
+        return None
+
+    def _evicted(self, item, reason):
+        self.evicted[reason] += 1
+        log.warning(f"{self.name}: evicted frame ({reason})")
+        if self.on_evict is not None:
+            self.on_evict(item)
@@ -1,3 +1,5 @@
+import math
+
 import numpy as np
 
 TABLE_W = 2740
@@ -12,6 +14,16 @@ RIGHT = 2
 POINTS_TO_WIN_GAME = 11
 MIN_DIFF = 2
 
+# Логика работает во времени захвата кадров, а не в номерах кадров:
+# координаты стола — в мм, скорости — в мм/с, интервалы — в секундах.
+# Пороги подобраны по прежним покадровым значениям при NOMINAL_FPS.
+NOMINAL_FPS = 30
+BOUNCE_MIN_VY = 42  # мм/с (было 2 мм²/кадр² для произведения скоростей)
+HIT_MIN_VX = 52  # мм/с (было 3 мм²/кадр²)
+NET_MIN_SPEED = 180  # мм/с (было 6 мм/кадр)
+NET_HANG = 0.1  # с, мяч «висит» у сетки (было 3 кадра)
+EVENT_COOLDOWN = 0.28  # с после события (было 8 кадров)
+
 
 def side_of_table(x):
     return LEFT if x < MID_X else RIGHT
@@ -92,55 +104,159 @@ class RallyFSM:
 
 
 class BallState:
+    """
+    Траектория мяча на равномерной сетке времени с шагом 1 / NOMINAL_FPS.
+
+    Точки приходят с метками времени захвата; между соседними точками
+    позиция интерполируется в узлы сетки (origin + k / NOMINAL_FPS), в узлах
+    сглаживается (alpha — вес новой точки) и по ним считаются скорость
+    в мм/с и её модуль. Детекторы смотрят только на узлы сетки, поэтому
+    пороги не зависят от частоты кадров, а события при пропусках инференса
+    в основном сохраняются (при 15 fps — почти все, при 10 fps часть
+    ударов теряется, см. test_ball_state.py).
+    Точка, попавшая в тот же шаг сетки, что и предыдущая, не отбрасывается,
+    а пересчитывает последний узел. Сетка отсчитывается от первой точки
+    траектории (origin), поэтому постоянный сдвиг меток её не меняет.
+
+    Узлы хранятся в кольцевом буфере NumPy; каждое значение пишется дважды
+    (i и i + max_history), поэтому последние узлы всегда лежат в буфере
+    подряд и history — срез без копирования.
+    """
+
     def __init__(self, max_history=10, alpha=0.6):
-        self.history = []
         self.filtered = None
         self.alpha = alpha
         self.max_history = max_history
-        self.cooldown = 0
+        self.cooldown_until = float("-inf")
         self.last_event = None
-
-    def update(self, x, y):
-        if self.filtered is None:
-            self.filtered = (x, y)
+        self.last_ts = None
+        # Сколько узлов сетки добавил (или уточнил) последний update()
+        self.new_steps = 0
+
+        # Столбцы: x, y (сглаженные), vx, vy, |v|; скорость — от предыдущего узла
+        self._buf = np.zeros((2 * max_history, 5))
+        self._times = np.zeros(2 * max_history)
+        self._head = 0  # куда писать следующий узел
+        self._count = 0
+        self._last_point = None
+        self._next_step = None
+        self._origin = None  # время узла 0 сетки
+
+    def __len__(self):
+        return self._count
+
+    def update(self, x, y, ts=None):
+        """
+        ts — время захвата кадра в секундах (любая монотонная шкала).
+        Без ts считается, что кадр пришёл через 1 / NOMINAL_FPS после предыдущего.
+        """
+        self.new_steps = 0
+        if ts is None:
+            ts = 0.0 if self.last_ts is None else self.last_ts + 1 / NOMINAL_FPS
+        elif self.last_ts is not None and ts <= self.last_ts:
+            # Повтор или перепутанный порядок — точка ничего не добавит
+            return
+
+        # Ближайший к ts узел сетки
+        step = None if self._origin is None else round((ts - self._origin) * NOMINAL_FPS)
+
+        if step is None or step - self._next_step >= self.max_history:
+            # Первая точка или мяч долго не было видно — старая траектория
+            # не продолжается, сетка отсчитывается заново от этой точки
+            self._origin = ts
+            self.filtered = None
+            self._count = 0
+            self._push(x, y, 0)
         else:
-            fx, fy = self.filtered
-            fx = self.alpha * x + (1 - self.alpha) * fx
-            fy = self.alpha * y + (1 - self.alpha) * fy
-            self.filtered = (fx, fy)
-
-        self.history.append(self.filtered)
-        if len(self.history) > self.max_history:
-            self.history.pop(0)
-
-
-def speed(p1, p2):
-    dx = p2[0] - p1[0]
-    dy = p2[1] - p1[1]
-    return np.hypot(dx, dy)
-
+            t0, x0, y0 = self._last_point
+            for k in range(self._next_step, step + 1):
+                tk = self._origin + k / NOMINAL_FPS
+                w = min(max((tk - t0) / (ts - t0), 0.0), 1.0)
+                self._push(x0 + w * (x - x0), y0 + w * (y - y0), k)
+            if self.new_steps == 0 and self._count:
+                # Точка в том же шаге сетки, что и последний узел (кадры пришли
+                # пачкой) — не теряем её, а уточняем этим узлом последний
+                self._push(x, y, self._next_step - 1, replace=True)
+
+        self._last_point = (ts, x, y)
+        self.last_ts = ts
+
+    def _push(self, x, y, step, replace=False):
+        n = self.max_history
+        if replace:
+            # Сглаживание заново — от узла перед заменяемым
+            self._head = (self._head - 1) % n
+            self._count -= 1
+            prev = self._buf[self._head + n - 1, :2] if self._count else None
+        else:
+            prev = self.filtered
 
-def velocity(p1, p2):
-    return p2[0] - p1[0], p2[1] - p1[1]
+        if prev is None:
+            fx, fy = x, y
+            vx = vy = 0.0
+        else:
+            px, py = prev
+            fx = self.alpha * x + (1 - self.alpha) * px
+            fy = self.alpha * y + (1 - self.alpha) * py
+            vx, vy = (fx - px) * NOMINAL_FPS, (fy - py) * NOMINAL_FPS
+        self.filtered = (fx, fy)
+
+        i = self._head
+        self._buf[i] = self._buf[i + n] = (fx, fy, vx, vy, math.hypot(vx, vy))
+        self._times[i] = self._times[i + n] = self._origin + step / NOMINAL_FPS
+        self._head = (i + 1) % n
+        self._count = min(self._count + 1, n)
+        self._next_step = step + 1
+        self.new_steps += 1
+
+    def _window(self, buf, lag=0):
+        end = self._head + self.max_history - lag
+        return buf[end - self._count + lag : end]
+
+    @property
+    def history(self):
+        """Сглаженные позиции в узлах сетки (N, 2), от старых к новым."""
+        return self._window(self._buf)[:, :2]
+
+    @property
+    def timestamps(self):
+        """Время узлов сетки, с."""
+        return self._window(self._times)
+
+    @property
+    def velocities(self):
+        """Скорости (мм/с) между соседними узлами, (N - 1, 2)."""
+        return self.recent_array(self._count)[1:, 2:4]
+
+    @property
+    def speeds(self):
+        return self.recent_array(self._count)[1:, 4]
+
+    def recent_array(self, k, lag=0):
+        return self._window(self._buf, lag)[-k:]
+
+    def recent(self, k, lag=0):
+        """
+        Последние k узлов (x, y, vx, vy, |v|) списками Python — для скалярных
+        проверок. lag — сколько самых новых узлов пропустить.
+        """
+        return self._window(self._buf, lag)[-k:].tolist()
 
 
-def detect_bounce(history, min_vy=2, speed_drop=0.75, max_x_change_ratio=0.3):
-    if len(history) < 4:
+def detect_bounce(
+    ball_state, min_vy=BOUNCE_MIN_VY, speed_drop=0.75, max_x_change_ratio=0.3, lag=0
+):
+    if len(ball_state) - lag < 4:
         return False
 
-    p1, p2, p3, p4 = history[-4:]
-
-    v1 = velocity(p1, p2)
-    v2 = velocity(p2, p3)
+    # Скорости между последними четырьмя точками p1..p4
+    (_, _, v1x, v1y, s1), (_, _, v2x, v2y, s2), _ = ball_state.recent(3, lag)
 
     # смена направления по Y
-    y_flip = v1[1] * v2[1] < -min_vy
+    y_flip = v1y * v2y < -(min_vy**2)
 
     # X почти не меняется
-    x_stable = abs(v2[0] - v1[0]) < abs(v1[0]) * max_x_change_ratio
-
-    s1 = speed(p1, p2)
-    s2 = speed(p2, p3)
+    x_stable = abs(v2x - v1x) < abs(v1x) * max_x_change_ratio
 
     speed_drop_ok = s2 < s1 * speed_drop
 
@@ -154,47 +270,50 @@ def angle(v1, v2):
     return np.degrees(np.arccos(np.clip(cos, -1, 1)))
 
 
-def detect_hit(history, min_vx=3, speed_gain=1.2):
-    if len(history) < 4:
+def detect_hit(ball_state, min_vx=HIT_MIN_VX, speed_gain=1.2, lag=0):
+    if len(ball_state) - lag < 4:
         return False
 
-    p1, p2, p3, p4 = history[-4:]
-
-    v1 = velocity(p1, p2)
-    v2 = velocity(p3, p4)
+    # Скорость p1 -> p2 против скорости p3 -> p4
+    (_, _, v1x, _, s1), _, (_, _, v2x, _, s2) = ball_state.recent(3, lag)
 
     # смена направления по X
-    x_flip = v1[0] * v2[0] < -min_vx
+    x_flip = v1x * v2x < -(min_vx**2)
 
     # Y не обязан меняться
-    s1 = speed(p1, p2)
-    s2 = speed(p3, p4)
-
     speed_gain_ok = s2 > s1 * speed_gain
 
     return x_flip and speed_gain_ok
 
 
 def detect_net(
-    history, mid_x, net_zone=25, min_speed_before=6, speed_drop_ratio=0.4, hang_frames=3
+    ball_state,
+    mid_x,
+    net_zone=25,
+    min_speed_before=NET_MIN_SPEED,
+    speed_drop_ratio=0.4,
+    hang=NET_HANG,
+    lag=0,
 ):
-    if len(history) < hang_frames + 2:
+    """
+    Мяч подлетел к сетке быстро и затем не меньше hang секунд почти стоит у неё.
+    """
+    hang_steps = max(1, round(hang * NOMINAL_FPS))
+    if len(ball_state) - lag < hang_steps + 2:
         return False
 
-    pts = history[-(hang_frames + 2) :]
-
-    speeds = [
-        np.hypot(pts[i + 1][0] - pts[i][0], pts[i + 1][1] - pts[i][1]) for i in range(len(pts) - 1)
-    ]
+    rows = ball_state.recent(hang_steps + 1, lag)
+    first = rows[0][4]
 
-    if speeds[0] < min_speed_before:
+    if first < min_speed_before:
         return False
 
-    slow_frames = sum(s < speeds[0] * speed_drop_ratio for s in speeds[1:])
+    slow_frames = sum(row[4] < first * speed_drop_ratio for row in rows[1:])
 
-    near_net = all(abs(p[0] - mid_x) < net_zone for p in pts[1:-1])
+    # Все точки, кроме первой и последней, у сетки
+    near_net = all(abs(row[0] - mid_x) < net_zone for row in rows[:-1])
 
-    return slow_frames >= hang_frames and near_net
+    return slow_frames >= hang_steps and near_net
 
 
 def inside_table(x, y):
@@ -205,27 +324,35 @@ def detect_out(x, y, w, h):
     return x < 0 or x > w or y < 0 or y > h
 
 
-def detect_event(ball_state, x, y):
-    if ball_state.cooldown > 0:
-        ball_state.cooldown -= 1
+def detect_event(ball_state, x, y, cooldown=EVENT_COOLDOWN):
+    """
+    Событие по узлам сетки, добавленным последним BallState.update()
+    (x, y — последняя точка без сглаживания). Если узлов добавилось несколько
+    (кадры пропущены), детекторы проверяются в каждом, от старого к новому.
+    После события cooldown секунд новые события не выдаются.
+    """
+    if ball_state.new_steps == 0:
         return None
 
-    h = ball_state.history
-
-    if detect_out(x, y, TABLE_W, TABLE_H):
-        event = "OUT"
-    elif detect_bounce(h) and inside_table(x, y):
-        event = "BOUNCE"
-    elif detect_net(ball_state.history, MID_X):
-        event = "NET"
-    elif detect_hit(h):
-        event = "HIT"
-    else:
-        event = None
+    times = ball_state.timestamps
+    for lag in range(min(ball_state.new_steps, len(times)) - 1, -1, -1):
+        t = times[-1 - lag]
+        if t < ball_state.cooldown_until:
+            continue
+
+        if detect_out(x, y, TABLE_W, TABLE_H):
+            event = "OUT"
+        elif detect_bounce(ball_state, lag=lag) and inside_table(x, y):
+            event = "BOUNCE"
+        elif detect_net(ball_state, MID_X, lag=lag):
+            event = "NET"
+        elif detect_hit(ball_state, lag=lag):
+            event = "HIT"
+        else:
+            continue
 
-    if event:
         ball_state.last_event = event
-        ball_state.cooldown = 8
+        ball_state.cooldown_until = t + cooldown
         return event
 
     return None
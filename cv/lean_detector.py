@@ -0,0 +1,168 @@
+import cv2
+import numpy as np
+
+# Цвет паддинга letterbox — как в ultralytics
+PAD_VALUE = 114
+
+
+def letterbox_geometry(shape, new_shape, auto=False, stride=32):
+    """
+    Геометрия letterbox ultralytics (LetterBox) для кадра shape=(h, w):
+    ((H, W) входа модели, (w, h) кадра после масштабирования, (left, top)).
+    auto=True — минимальный прямоугольник, кратный stride, вместо new_shape.
+    """
+    h, w = shape
+    r = min(new_shape[0] / h, new_shape[1] / w)
+    nw, nh = round(w * r), round(h * r)
+    dw, dh = new_shape[1] - nw, new_shape[0] - nh
+    if auto:
+        dw, dh = dw % stride, dh % stride
+    dw, dh = dw / 2, dh / 2
+    top, bottom = round(dh - 0.1), round(dh + 0.1)
+    left, right = round(dw - 0.1), round(dw + 0.1)
+    return (nh + top + bottom, nw + left + right), (nw, nh), (left, top)
+
+
+def letterbox_into(dst, frame, size, offset):
+    """Letterbox кадра прямо в буфер dst (H, W, 3), без промежуточных изображений."""
+    nw, nh = size
+    left, top = offset
+    dst[:top] = PAD_VALUE
+    dst[top + nh :] = PAD_VALUE
+    dst[top : top + nh, :left] = PAD_VALUE
+    dst[top : top + nh, left + nw :] = PAD_VALUE
+    inner = dst[top : top + nh, left : left + nw]
+    if frame.shape[:2] == (nh, nw):
+        inner[:] = frame
+    else:
+        cv2.resize(frame, size, dst=inner, interpolation=cv2.INTER_LINEAR)
+
+
+def unletterbox(dets, input_shape, frame_shape):
+    """
+    Боксы [x1, y1, x2, y2, ...] из координат входа модели в координаты
+    кадра, на месте (тот же расчёт, что ultralytics.utils.ops.scale_boxes).
+    """
+    (ih, iw), (h, w) = input_shape, frame_shape
+    gain = min(ih / h, iw / w)
+    pad_x = round((iw - w * gain) / 2 - 0.1)
+    pad_y = round((ih - h * gain) / 2 - 0.1)
+    dets[:, [0, 2]] -= pad_x
+    dets[:, [1, 3]] -= pad_y
+    dets[:, :4] /= gain
+    dets[:, [0, 2]] = dets[:, [0, 2]].clip(0, w)
+    dets[:, [1, 3]] = dets[:, [1, 3]].clip(0, h)
+
+
+class LeanDetector:
+    """
+    Detector без предиктора ultralytics: та же модель (AutoBackend — .pt,
+    .onnx или OpenVINO), тот же препроцессинг и NMS, но без контекста
+    предиктора, новых тензоров и объектов Results на каждый вызов.
+
+    Кадры letterbox'ятся сразу в заранее выделенный буфер, вход модели —
+    заранее выделенный тензор той же формы; результаты всего батча
+    переносятся с устройства одним массивом [x1, y1, x2, y2, conf, cls].
+    Контракт detect() — как у tt_processor.Detector.
+
+    threads — число потоков torch на CPU (0 — не менять).
+    """
+
+    def __init__(self, model_path, conf=0.2, iou=0.7, imgsz=640, threads=0, max_det=300):
+        # torch и ultralytics — только там, где модель реально нужна
+        import torch
+        from ultralytics.nn.autobackend import AutoBackend
+        from ultralytics.utils.nms import non_max_suppression
+
+        if threads:
+            torch.set_num_threads(threads)
+        self._torch = torch
+        self._nms = non_max_suppression
+
+        device = torch.device("cuda:0" if torch.cuda.is_available() else "cpu")
+        self.model = AutoBackend(
+            model_path, device=device, fp16=device.type != "cpu", fuse=True, verbose=False
+        )
+        self.model.eval()
+        self.device = self.model.device
+        self.conf = conf
+        self.iou = iou
+        self.max_det = max_det
+        self.stride = int(self.model.stride)
+
+        # Как в предикторе: размер входа из экспорта для моделей с фиксированной
+        # формой, минимальный прямоугольник — если бэкенд принимает любую форму
+        dynamic = getattr(self.model, "dynamic", False)
+        if hasattr(self.model, "imgsz") and not dynamic:
+            imgsz = self.model.imgsz
+        self.imgsz = (imgsz, imgsz) if isinstance(imgsz, int) else tuple(imgsz)
+        self.rect = self.model.pt or dynamic
+
+        # Буферы по форме входа: (кадры uint8 NHWC, вход модели NCHW)
+        self._buffers = {}
+
+    def _buffer(self, n, shape):
+        frames, inputs = self._buffers.get(shape, (None, None))
+        if frames is None or len(frames) < n:
+            torch = self._torch
+            frames = np.empty((n, *shape, 3), dtype=np.uint8)
+            dtype = torch.half if self.model.fp16 else torch.float
+            inputs = torch.empty((n, 3, *shape), dtype=dtype, device=self.device)
+            self._buffers[shape] = frames, inputs
+        return frames, inputs
+
+    def detect(self, frames, roi=None):
+        """
+        roi=(x1, y1, x2, y2) — детекция только внутри области, боксы
+        возвращаются в координатах полного кадра. Можно передать список
+        областей — по одной на кадр (None — полный кадр).
+        """
+        frames = list(frames)
+        if not frames:
+            return []
+        rois = roi if isinstance(roi, list) else [roi] * len(frames)
+
+        offsets = np.zeros((len(frames), 4), dtype=np.float32)
+        for i, (frame, r) in enumerate(zip(frames, rois)):
+            if r is None:
+                continue
+            h, w = frame.shape[:2]
+            x1, y1 = max(0, r[0]), max(0, r[1])
+            x2, y2 = min(w, r[2]), min(h, r[3])
+            frames[i] = frame[y1:y2, x1:x2]
+            offsets[i] = (x1, y1, x1, y1)
+
+        # Прямоугольный вход — только если все кадры одной формы (как в предикторе)
+        shapes = [frame.shape[:2] for frame in frames]
+        auto = self.rect and len(set(shapes)) == 1
+        geometry = [letterbox_geometry(s, self.imgsz, auto, self.stride) for s in shapes]
+        input_shape = geometry[0][0]
+
+        n = len(frames)
+        buf, inputs = self._buffer(n, input_shape)
+        for frame, (_, size, offset), dst in zip(frames, geometry, buf):
+            letterbox_into(dst, frame, size, offset)
+
+        torch = self._torch
+        x = inputs[:n]
+        # BGR HWC uint8 -> RGB CHW 0..1 в заранее выделенном тензоре
+        x.copy_(torch.from_numpy(buf[:n]).to(self.device).permute(0, 3, 1, 2).flip(1))
+        x /= 255
+
+        with torch.inference_mode():
+            preds = self.model(x)
+            out = self._nms(
+                preds,
+                self.conf,
+                self.iou,
+                max_det=self.max_det,
+                end2end=getattr(self.model, "end2end", False),
+            )
+            counts = [len(d) for d in out]
+            dets = torch.cat(out)[:, :6].float().cpu().numpy()
+
+        detections = np.split(dets, np.cumsum(counts)[:-1])
+        for d, shape, offset in zip(detections, shapes, offsets):
+            unletterbox(d, input_shape, shape)
+            d[:, :4] += offset
+        return detections
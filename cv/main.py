@@ -1,11 +1,25 @@
+import json
 import logging
 import queue
 import threading
 import time
+import uuid
+from functools import partial
 
+from backends import resolve_model_path
+from frame_pool import FramePool
+from frame_queue import QUEUE_DROP_OLDEST, LatencyBoundedQueue
+from game_logic import LEFT, RIGHT, RallyState
+from metadata import MetadataHub, MetadataServer
+from metrics import MetricsServer, Registry
+from pipeline import StagedPipeline
 from reader import RTSPReader
+from scheduler import MODES, InferenceScheduler
+from score_publisher import ScorePublisher
+from shared_inference import SharedDetector
 from tt_processor import TableTennisProcessor
-from writer import RTSPWriter
+from writer import RTSPRelay, RTSPWriter
+from yuv import PIX_FMT_BGR, check_pix_fmt
 
 logging.basicConfig(level=logging.INFO)
 log = logging.getLogger("main")
@@ -16,61 +30,774 @@ import os
 WIDTH = int(os.getenv("WIDTH", "1920"))
 HEIGHT = int(os.getenv("HEIGHT", "1080"))
 FPS = int(os.getenv("FPS", "30"))
+# Формат кадров между ffmpeg и Python: bgr24, yuv420p или nv12 (вдвое меньше байт на кадр)
+PIXEL_FORMAT = os.getenv("PIXEL_FORMAT", PIX_FMT_BGR)
+check_pix_fmt(PIXEL_FORMAT, WIDTH, HEIGHT)
+# Размер кадра для детектора: ffmpeg отдаёт его вторым выходом того же
+# декодирования (0 — детектор работает на полном кадре)
+INFER_WIDTH = int(os.getenv("INFER_WIDTH", "0"))
+INFER_HEIGHT = int(os.getenv("INFER_HEIGHT", "0"))
+INFER_SIZE = (INFER_WIDTH, INFER_HEIGHT) if INFER_WIDTH and INFER_HEIGHT else None
 
 INPUT_QUEUE_SIZE = int(os.getenv("INPUT_QUEUE_SIZE", "60"))
 OUTPUT_QUEUE_SIZE = int(os.getenv("OUTPUT_QUEUE_SIZE", "60"))
 
-input_queue = queue.Queue(maxsize=INPUT_QUEUE_SIZE)
-output_queue = queue.Queue(maxsize=OUTPUT_QUEUE_SIZE)
+# Политика очередей: drop_newest — новые кадры отбрасываются при переполнении,
+# drop_oldest — вытесняются самые старые, кадры старше MAX_FRAME_AGE секунд отбрасываются.
+# Во входной очереди возраст считается от захвата кадра, в выходной — от постановки
+# в неё: обработанный кадр не должен выбрасываться из-за времени на декод и инференс
+QUEUE_POLICY = os.getenv("QUEUE_POLICY", "drop_newest")
+MAX_FRAME_AGE = float(os.getenv("MAX_FRAME_AGE", "0.5"))
+OUTPUT_MAX_FRAME_AGE = float(os.getenv("OUTPUT_MAX_FRAME_AGE", "1.0"))
+
+# Сколько кадров из очереди забирать на один вызов модели
+BATCH_SIZE = int(os.getenv("BATCH_SIZE", "4"))
+# Сколько writer ждёт кадр сверх его такта, прежде чем повторить предыдущий:
+# по умолчанию — длительность батча плюс кадр
+WRITER_MAX_DELAY = float(os.getenv("WRITER_MAX_DELAY", str((BATCH_SIZE + 1) / FPS)))
+
+# Пул кадров: бюджет памяти в МБ и поведение при исчерпании (block | drop)
+FRAME_POOL_MB = int(os.getenv("FRAME_POOL_MB", "512"))
+FRAME_POOL_POLICY = os.getenv("FRAME_POOL_POLICY", "drop")
 
 # RTSP URL
 INPUT_URL = os.getenv("INPUT_URL", "rtsp://147.45.159.99:8554/live/tennis")
 OUTPUT_URL = os.getenv("OUTPUT_URL", "rtsp://147.45.159.99:8554/live/processed_tennis")
 
-# Потоки чтения и записи
-reader = RTSPReader(INPUT_URL, WIDTH, HEIGHT, FPS, input_queue)
-writer = RTSPWriter(output_queue, OUTPUT_URL, WIDTH, HEIGHT, FPS)
+# Бэкенд инференса: torch | onnx | openvino; экспортированная модель ищется рядом с MODEL_PATH
+MODEL_BACKEND = os.getenv("MODEL_BACKEND", "torch")
+MODEL_INT8 = os.getenv("MODEL_INT8", "0") == "1"
+MODEL_PATH = resolve_model_path(
+    os.getenv("MODEL_PATH", "model/ppv_yolo11s_based.pt"), MODEL_BACKEND, MODEL_INT8
+)
+# Инференс без предиктора ultralytics: предвыделенные буферы, NMS и один
+# массив детекций на батч (см. LeanDetector); потоки torch на CPU (0 — по умолчанию)
+LEAN_INFERENCE = os.getenv("LEAN_INFERENCE", "0") == "1"
+INFER_THREADS = int(os.getenv("INFER_THREADS", "0"))
+CORNERS_JSON = os.getenv("CORNERS_JSON", "table_corners.json")
+# Масштаб вида сверху относительно 2740x1525
+TOP_VIEW_SCALE = float(os.getenv("TOP_VIEW_SCALE", "0.25"))
+# Детекция только в области вокруг стола; отступы — доли ширины стола в кадре
+DETECT_ROI = os.getenv("DETECT_ROI", "0") == "1"
+ROI_MARGIN = float(os.getenv("ROI_MARGIN", "0.15"))
+ROI_MARGIN_TOP = float(os.getenv("ROI_MARGIN_TOP", "0.6"))
+# Детекция в окне вокруг предсказанного положения мяча (только PIPELINE=threads)
+DETECT_TRACK = os.getenv("DETECT_TRACK", "0") == "1"
+TRACK_WINDOW = int(os.getenv("TRACK_WINDOW", "320"))
+TRACK_MAX_MISSES = int(os.getenv("TRACK_MAX_MISSES", "3"))
+# Таблица пиксель -> координаты стола рядом с CORNERS_JSON (шаг сетки в пикселях)
+TABLE_LUT = os.getenv("TABLE_LUT", "0") == "1"
+TABLE_LUT_STEP = int(os.getenv("TABLE_LUT_STEP", "1"))
+# Вид сверху рисуется только если его кто-то смотрит: отдельный поток с пониженным FPS.
+# TOP_VIEW_FPS=0 — вид сверху выключен, даже если задан TOP_VIEW_URL
+TOP_VIEW_URL = os.getenv("TOP_VIEW_URL", "")
+TOP_VIEW_FPS = int(os.getenv("TOP_VIEW_FPS", "5"))
+# Между розыгрышами модель запускается только при движении над столом
+# (разность кадров по уменьшенной яркости); в покое — на каждом
+# MOTION_IDLE_EVERY-м кадре, 0 — не запускается совсем
+MOTION_GATE = os.getenv("MOTION_GATE", "0") == "1"
+MOTION_THRESHOLD = int(os.getenv("MOTION_THRESHOLD", "15"))
+MOTION_IDLE_EVERY = int(os.getenv("MOTION_IDLE_EVERY", str(FPS)))
+# Адаптивный режим инференса по задержке: целевой возраст кадра в секундах (0 — выключено)
+TARGET_LATENCY = float(os.getenv("TARGET_LATENCY", "0"))
+SKIP_EVERY = int(os.getenv("SKIP_EVERY", "3"))
 
-reader.start()
-writer.start()
+# Режим конвейера: threads — всё в одном процессе, staged — стадии в отдельных процессах
+PIPELINE = os.getenv("PIPELINE", "threads")
+INFER_WORKERS = int(os.getenv("INFER_WORKERS", "1"))
+OVERLAY_WORKERS = int(os.getenv("OVERLAY_WORKERS", "1"))
+STAGE_QUEUE_SIZE = int(os.getenv("STAGE_QUEUE_SIZE", "16"))
+STAGE_ORDERED = os.getenv("STAGE_ORDERED", "1") == "1"
+REORDER_WINDOW = int(os.getenv("REORDER_WINDOW", "64"))
 
-# Инициализация YOLO + логика игры
-processor = TableTennisProcessor(
-    model_path=os.getenv("MODEL_PATH", "model/ppv_yolo11s_based.pt"),
-    corners_json=os.getenv("CORNERS_JSON", "table_corners.json"),
-)
+# Несколько камер/столов в одном процессе: JSON со списком потоков (см. load_streams);
+# пусто — один поток из INPUT_URL/OUTPUT_URL/CORNERS_JSON/TOP_VIEW_URL.
+# Модель общая: кадры всех потоков батчатся вместе, до SHARED_BATCH_SIZE
+# (0 — BATCH_SIZE на каждый поток)
+STREAMS_JSON = os.getenv("STREAMS_JSON", "")
+SHARED_BATCH_SIZE = int(os.getenv("SHARED_BATCH_SIZE", "0"))
+
+# API для live-счёта (например, http://api:8000): выигранные очки уходят
+# в POST /api/v1/session/update/{player}; пусто — не отправлять
+SCORE_API_URL = os.getenv("SCORE_API_URL", "")
+# Сколько секунд пытаться доставить очко, пока API недоступен
+SCORE_MAX_AGE = float(os.getenv("SCORE_MAX_AGE", "30"))
 
+# Выход: overlay — оверлей рисуется в кадре и кадр кодируется заново (libx264);
+# passthrough — входной поток ретранслируется как есть (-c copy), а боксы,
+# траектории, зоны и счёт клиенты получают по SSE (METADATA_PORT) и рисуют сами
+OUTPUT_OVERLAY = "overlay"
+OUTPUT_PASSTHROUGH = "passthrough"
+OUTPUT_MODE = os.getenv("OUTPUT_MODE", OUTPUT_OVERLAY)
+# Порт HTTP /events (SSE с данными оверлея), 0 — выключено
+METADATA_PORT = int(os.getenv("METADATA_PORT", "8081"))
+
+# Порт HTTP /metrics (Prometheus), 0 — выключено
+METRICS_PORT = int(os.getenv("METRICS_PORT", "8080"))
+
+def processing_loop(
+    processor,
+    frame_pool,
+    input_queue,
+    output_queue,
+    stats,
+    top_view_queue=None,
+    scheduler=None,
+    metadata=None,
+):
+    """
+    stats — счётчики цикла для /metrics: {"output_queue_full", "processing_errors"}.
+    output_queue=None — кадры никуда не пишутся (видео ретранслируется как есть),
+    слоты сразу возвращаются в пул и на кадрах ничего не рисуется.
+    metadata(frame_no, ts, overlay) — данные оверлея каждого кадра для клиентов.
+    """
+    # Каждый top_view_every-й кадр уходит во второй поток с видом сверху
+    if TOP_VIEW_FPS <= 0:
+        top_view_queue = None
+    top_view_every = max(1, FPS // max(1, TOP_VIEW_FPS))
+    frame_no = 0
 
-def processing_loop():
     while True:
         try:
-            frame = input_queue.get(timeout=0.03)
+            batch = [input_queue.get(timeout=0.03)]
         except queue.Empty:
             continue
 
+        # Добираем то, что уже накопилось в очереди, не дожидаясь новых кадров
+        while len(batch) < BATCH_SIZE:
+            try:
+                batch.append(input_queue.get_nowait())
+            except queue.Empty:
+                break
+
+        if top_view_queue is None:
+            want_top_view = False
+        else:
+            want_top_view = [(frame_no + i) % top_view_every == 0 for i in range(len(batch))]
+        first_no = frame_no
+        frame_no += len(batch)
+
+        infer, overlays = True, True
+        if scheduler is not None:
+            frame_age = time.monotonic() - frame_pool.timestamp(batch[0])
+            scheduler.observe(input_queue.qsize(), frame_age)
+            infer, overlays = scheduler.plan(len(batch))
+        if output_queue is None:
+            overlays = False
+
+        infer_frames = None
+        if frame_pool.infer_shape is not None:
+            infer_frames = [frame_pool.view_infer(idx) for idx in batch]
+
+        # Рисуем прямо в слотах пула, те же слоты уходят writer'у
         try:
-            processed_frame, _ = processor.process_frame(frame)
+            results = processor.process_batch(
+                [frame_pool.view(idx) for idx in batch],
+                copy=False,
+                top_view=want_top_view,
+                infer=infer,
+                overlays=overlays,
+                timestamps=[frame_pool.timestamp(idx) for idx in batch],
+                infer_frames=infer_frames,
+            )
         except Exception as e:
-            log.error(f"Processing error: {e}, forwarding raw frame")
-            processed_frame = frame.copy()
+            stats["processing_errors"] += 1
+            log.error(f"Processing error: {e}, forwarding raw frames")
+            results = []
 
-        try:
-            output_queue.put_nowait(processed_frame)
-        except queue.Full:
-            log.warning("Output queue full — dropping frame")
+        for _, top_view in results:
+            if top_view is None:
+                continue
+            # libx264 требует чётные размеры; копия — буфер вида сверху переиспользуется
+            h, w = top_view.shape[0] & ~1, top_view.shape[1] & ~1
+            try:
+                top_view_queue.put_nowait(top_view[:h, :w].copy())
+            except queue.Full:
+                pass
+
+        if metadata is not None and results:
+            for i, (idx, overlay) in enumerate(zip(batch, processor.last_overlays)):
+                metadata(first_no + i, frame_pool.timestamp(idx), overlay)
+
+        for idx in batch:
+            if output_queue is None:
+                frame_pool.release(idx)
+                continue
+            try:
+                output_queue.put(idx, block=FRAME_POOL_POLICY == "block")
+            except queue.Full:
+                frame_pool.release(idx)
+                stats["output_queue_full"] += 1
+                log.warning("Output queue full — dropping frame")
+
+
+def load_streams(path):
+    """
+    Потоки камер из JSON:
+    {"streams": [{"name", "input_url", "output_url", "corners_json",
+                  "top_view_url"?, "api_url"?, "output_mode"?}, ...]}
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        streams = json.load(f)["streams"]
+
+    names = set()
+    for stream in streams:
+        missing = {"name", "input_url", "output_url", "corners_json"} - stream.keys()
+        if missing:
+            raise ValueError(f"Stream config {stream} is missing {sorted(missing)}")
+        if stream["name"] in names:
+            raise ValueError(f"Duplicate stream name: {stream['name']}")
+        names.add(stream["name"])
+    if not streams:
+        raise ValueError(f"No streams in {path}")
+    return streams
+
+
+class LiveStream:
+    """
+    Один поток камеры в режиме threads: reader -> processing_loop -> writer
+    со своим пулом кадров, очередями, столом (corners_json), игрой и выходом.
+
+    detector — общий детектор нескольких потоков (shared_inference.DetectorClient);
+    без него процессор загружает свою модель MODEL_PATH.
+    api_url — куда отправлять выигранные очки (ScorePublisher).
+    output_mode=passthrough — видео ретранслируется без перекодирования,
+    оверлей уходит клиентам только как данные (metadata, см. MetadataHub).
+    """
+
+    def __init__(
+        self,
+        name,
+        input_url,
+        output_url,
+        corners_json,
+        top_view_url="",
+        detector=None,
+        pool_mb=FRAME_POOL_MB,
+        api_url="",
+        output_mode=OUTPUT_OVERLAY,
+        metadata=None,
+    ):
+        if output_mode not in (OUTPUT_OVERLAY, OUTPUT_PASSTHROUGH):
+            raise ValueError(f"Unknown output mode: {output_mode}")
+        self.name = name
+        # Счётчики цикла обработки (для /metrics)
+        self.stats = {"output_queue_full": 0, "processing_errors": 0}
+
+        # +2 слота: один кадр в обработке и один удерживается writer'ом для повтора
+        self.frame_pool = FramePool(
+            WIDTH,
+            HEIGHT,
+            slots=INPUT_QUEUE_SIZE + OUTPUT_QUEUE_SIZE + 2,
+            max_bytes=pool_mb * 1024 * 1024,
+            pix_fmt=PIXEL_FORMAT,
+            infer_size=INFER_SIZE,
+        )
+
+        if QUEUE_POLICY == QUEUE_DROP_OLDEST:
+            # Возраст кадра считается от захвата, вытесненные слоты сразу возвращаются в пул
+            self.input_queue = LatencyBoundedQueue(
+                INPUT_QUEUE_SIZE,
+                max_age=MAX_FRAME_AGE,
+                timestamp=self.frame_pool.timestamp,
+                on_evict=self.frame_pool.release,
+                name=f"{name}_input_queue",
+            )
+            self.output_queue = LatencyBoundedQueue(
+                OUTPUT_QUEUE_SIZE,
+                max_age=OUTPUT_MAX_FRAME_AGE,
+                on_evict=self.frame_pool.release,
+                name=f"{name}_output_queue",
+            )
+        else:
+            self.input_queue = queue.Queue(maxsize=INPUT_QUEUE_SIZE)
+            self.output_queue = queue.Queue(maxsize=OUTPUT_QUEUE_SIZE)
+        if output_mode == OUTPUT_PASSTHROUGH:
+            self.output_queue = None
+
+        # Потоки чтения и записи
+        self.reader = RTSPReader(
+            input_url,
+            WIDTH,
+            HEIGHT,
+            FPS,
+            self.input_queue,
+            pool=self.frame_pool,
+            policy=FRAME_POOL_POLICY,
+            pix_fmt=PIXEL_FORMAT,
+        )
+        self.writer = None
+        self.relay = None
+        if output_mode == OUTPUT_PASSTHROUGH:
+            self.relay = RTSPRelay(input_url, output_url)
+        else:
+            self.writer = RTSPWriter(
+                self.output_queue,
+                output_url,
+                WIDTH,
+                HEIGHT,
+                FPS,
+                pool=self.frame_pool,
+                pix_fmt=PIXEL_FORMAT,
+                max_delay=WRITER_MAX_DELAY,
+            )
+
+        # Инициализация YOLO + логика игры
+        self.processor = TableTennisProcessor(
+            model_path=None if detector is not None else MODEL_PATH,
+            corners_json=corners_json,
+            top_view_scale=TOP_VIEW_SCALE,
+            roi=DETECT_ROI,
+            roi_margin=ROI_MARGIN,
+            roi_margin_top=ROI_MARGIN_TOP,
+            track=DETECT_TRACK,
+            track_window=TRACK_WINDOW,
+            track_max_misses=TRACK_MAX_MISSES,
+            table_lut=TABLE_LUT,
+            table_lut_step=TABLE_LUT_STEP,
+            frame_size=(WIDTH, HEIGHT),
+            pix_fmt=PIXEL_FORMAT,
+            detector=detector,
+            motion_gate=MOTION_GATE,
+            motion_threshold=MOTION_THRESHOLD,
+            motion_idle_every=MOTION_IDLE_EVERY,
+            lean=LEAN_INFERENCE,
+            infer_threads=INFER_THREADS,
+        )
+
+        self.top_view_queue = None
+        self.top_view_writer = None
+        if top_view_url and TOP_VIEW_FPS > 0:
+            self.top_view_queue = queue.Queue(maxsize=2)
+            h, w = self.processor.top_view.background.shape[:2]
+            self.top_view_writer = RTSPWriter(
+                self.top_view_queue, top_view_url, w & ~1, h & ~1, TOP_VIEW_FPS
+            )
+
+        self.publisher = None
+        if api_url:
+            # source уникален для запуска: API отличает повторы от новых событий
+            self.publisher = ScorePublisher(
+                api_url, source=f"{name}-{uuid.uuid4().hex[:8]}", max_age=SCORE_MAX_AGE
+            )
+            self.processor.on_event = self.publisher.on_event
+
+        if metadata is not None:
+            metadata.set_table(name, self.processor.src_corners, (WIDTH, HEIGHT))
+            # metadata(frame_no, ts, overlay) -> metadata.publish(name, frame_no, ts, overlay)
+            publish_metadata = partial(metadata.publish, name)
+        else:
+            publish_metadata = None
+
+        self.scheduler = None
+        if TARGET_LATENCY > 0:
+            self.scheduler = InferenceScheduler(
+                target_latency=TARGET_LATENCY, skip_every=SKIP_EVERY, queue_size=INPUT_QUEUE_SIZE
+            )
+
+        self.processing_thread = threading.Thread(
+            target=processing_loop,
+            args=(
+                self.processor,
+                self.frame_pool,
+                self.input_queue,
+                self.output_queue,
+                self.stats,
+                self.top_view_queue,
+                self.scheduler,
+                publish_metadata,
+            ),
+            name=f"processing-{name}",
+            daemon=True,
+        )
+
+    def outputs(self):
+        """Потоки с ffmpeg на выход: writer или relay, и вид сверху."""
+        threads = {}
+        if self.writer is not None:
+            threads["writer"] = self.writer
+        if self.relay is not None:
+            threads["relay"] = self.relay
+        if self.top_view_writer is not None:
+            threads["top_view"] = self.top_view_writer
+        return threads
+
+    def start(self):
+        self.reader.start()
+        for thread in self.outputs().values():
+            thread.start()
+        if self.publisher is not None:
+            self.publisher.start()
+        self.processing_thread.start()
+
+    def stop(self, timeout=5):
+        # Сначала reader: без stop() он висит в read() из pipe ffmpeg
+        self.reader.stop()
+        self.reader.join(timeout)
+        self.input_queue.put(None)
+        if self.output_queue is not None:
+            self.output_queue.put(None)
+        if self.top_view_queue is not None:
+            self.top_view_queue.put(None)
+        if self.relay is not None:
+            self.relay.stop()
+        if self.writer is not None:
+            self.writer.join(timeout)
+        if self.top_view_writer is not None:
+            self.top_view_writer.join(timeout)
+        if self.publisher is not None:
+            self.publisher.stop()
+
+
+def start_threads():
+    if STREAMS_JSON:
+        configs = load_streams(STREAMS_JSON)
+    else:
+        configs = [
+            {
+                "name": "main",
+                "input_url": INPUT_URL,
+                "output_url": OUTPUT_URL,
+                "corners_json": CORNERS_JSON,
+                "top_view_url": TOP_VIEW_URL,
+            }
+        ]
+
+    hub = MetadataHub() if METADATA_PORT else None
+
+    # Несколько потоков — одна модель в памяти, кадры потоков батчатся вместе
+    shared = None
+    if len(configs) > 1:
+        from tt_processor import make_detector
+
+        detector = make_detector(MODEL_PATH, lean=LEAN_INFERENCE, threads=INFER_THREADS)
+        shared = SharedDetector(
+            detector, max_batch=SHARED_BATCH_SIZE or BATCH_SIZE * len(configs)
+        )
+        shared.start()
+
+    streams = [
+        LiveStream(
+            config["name"],
+            config["input_url"],
+            config["output_url"],
+            config["corners_json"],
+            top_view_url=config.get("top_view_url", ""),
+            detector=shared.client(config["name"]) if shared is not None else None,
+            pool_mb=FRAME_POOL_MB // len(configs),
+            api_url=config.get("api_url", SCORE_API_URL),
+            output_mode=config.get("output_mode", OUTPUT_MODE),
+            metadata=hub,
+        )
+        for config in configs
+    ]
+    for stream in streams:
+        log.info(f"Starting stream {stream.name}")
+        stream.start()
+
+    metadata_server = None
+    if hub is not None:
+        metadata_server = MetadataServer(hub, METADATA_PORT)
+        metadata_server.start()
+
+    metrics_server = None
+    if METRICS_PORT:
+        metrics_server = MetricsServer(build_metrics(streams, shared, hub), METRICS_PORT)
+        metrics_server.start()
+
+    def stop():
+        if metrics_server is not None:
+            metrics_server.stop()
+        if metadata_server is not None:
+            metadata_server.stop()
+        for stream in streams:
+            stream.stop()
+        if shared is not None:
+            shared.stop()
+
+    return stop
+
+
+def build_metrics(streams, shared=None, metadata=None):
+    """
+    Метрики live-режима (threads) для /metrics, с меткой stream по потокам
+    камер. Значения очередей, счётчиков и состояния игры читаются в момент
+    запроса, длительности стадий приходят через колбэки on_timing/on_write.
+    """
+    registry = Registry()
+
+    def per_stream(fn, items=None):
+        # fn(item) -> [(labels, value)] по каждому потоку — с меткой потока
+        if items is None:
+            items = [(stream.name, stream) for stream in streams]
+        return lambda: [
+            ({"stream": name, **labels}, value) for name, item in items for labels, value in fn(item)
+        ]
+
+    registry.gauge(
+        "cv_queue_depth",
+        "Frames waiting in pipeline queues",
+        per_stream(
+            lambda s: [
+                ({"queue": name}, q.qsize())
+                for name, q in (("input", s.input_queue), ("output", s.output_queue))
+                if q is not None
+            ]
+        ),
+    )
+    registry.gauge(
+        "cv_frame_pool_free_slots",
+        "Free frame pool slots",
+        per_stream(lambda s: [({}, s.frame_pool.free_slots())]),
+    )
+
+    def dropped(s):
+        samples = [({"cause": cause}, n) for cause, n in s.reader.dropped.items()]
+        samples += [({"cause": cause}, n) for cause, n in s.stats.items()]
+        if s.writer is not None:
+            samples.append(({"cause": "writer_skipped"}, s.writer.skipped))
+        for name, q in (("input", s.input_queue), ("output", s.output_queue)):
+            for reason, n in getattr(q, "evicted", {}).items():
+                samples.append(({"cause": f"{name}_evicted_{reason}"}, n))
+        return samples
+
+    registry.counter(
+        "cv_dropped_frames_total", "Frames dropped or evicted by cause", per_stream(dropped)
+    )
+    writers = [(s.name, s.writer) for s in streams if s.writer is not None]
+    registry.counter(
+        "cv_output_frames_total",
+        "Frames written to the output ffmpeg",
+        per_stream(
+            lambda w: [
+                ({"kind": "new"}, w.written - w.duplicated),
+                ({"kind": "duplicated"}, w.duplicated),
+            ],
+            writers,
+        ),
+    )
+    registry.counter(
+        "cv_output_late_frames_total",
+        "Frames that missed their output tick and shifted the output clock",
+        per_stream(lambda w: [({}, w.late)], writers),
+    )
+
+    stage_seconds = registry.histogram(
+        "cv_stage_seconds",
+        "Per-frame latency of pipeline stages",
+        labelnames=("stream", "stage"),
+    )
+
+    for stream in streams:
+
+        def on_timing(stage, seconds, frames, name=stream.name):
+            for _ in range(frames):
+                stage_seconds.observe(seconds, stream=name, stage=stage)
+
+        stream.processor.on_timing = on_timing
+        if stream.writer is not None:
+            stream.writer.on_write = lambda seconds, name=stream.name: stage_seconds.observe(
+                seconds, stream=name, stage="encode"
+            )
+
+    def ffmpeg_up(s):
+        threads = {"reader": s.reader, **s.outputs()}
+        samples = []
+        for name, thread in threads.items():
+            proc = thread.proc
+            samples.append(({"process": name}, int(proc is not None and proc.poll() is None)))
+        return samples
+
+    registry.gauge(
+        "cv_ffmpeg_up", "Whether the ffmpeg subprocess is running", per_stream(ffmpeg_up)
+    )
+
+    registry.gauge(
+        "cv_game_score",
+        "Points in the current game",
+        per_stream(
+            lambda s: [
+                ({"side": "left"}, s.processor.current_game.score[LEFT]),
+                ({"side": "right"}, s.processor.current_game.score[RIGHT]),
+            ]
+        ),
+    )
+    registry.gauge(
+        "cv_games_won",
+        "Games won in the match",
+        per_stream(
+            lambda s: [
+                ({"side": "left"}, s.processor.match.games_won[LEFT]),
+                ({"side": "right"}, s.processor.match.games_won[RIGHT]),
+            ]
+        ),
+    )
+    registry.gauge(
+        "cv_rally_state",
+        "Current rally FSM state (1 for the active state)",
+        per_stream(
+            lambda s: [
+                ({"state": state.name}, int(s.processor.rally.state == state))
+                for state in RallyState
+            ]
+        ),
+    )
+    tracked = [(s.name, s.processor.tracker) for s in streams if s.processor.track]
+    if tracked:
+        registry.counter(
+            "cv_detection_path_total",
+            "Frames by detection path (search window / table ROI / full frame)",
+            per_stream(
+                lambda t: [({"path": path}, n) for path, n in t.counters.items()], tracked
+            ),
+        )
+
+    gated = [(s.name, s.processor.motion_gate) for s in streams if s.processor.motion_gate]
+    if gated:
+        registry.gauge(
+            "cv_inference_duty_cycle",
+            "Smoothed share of frames that run the detector",
+            per_stream(lambda g: [({}, g.duty_cycle)], gated),
+        )
+        registry.counter(
+            "cv_motion_gate_frames_total",
+            "Frames seen by the motion gate (inferred / gated off while idle)",
+            per_stream(
+                lambda g: [({"result": "inferred"}, g.inferred), ({"result": "gated"}, g.gated)],
+                gated,
+            ),
+        )
+
+    published = [(s.name, s.publisher) for s in streams if s.publisher is not None]
+    if published:
+        registry.counter(
+            "cv_score_points_total",
+            "Points reported to the API by outcome",
+            per_stream(
+                lambda p: [
+                    ({"status": "sent"}, p.sent),
+                    ({"status": "dropped"}, p.dropped),
+                    ({"status": "expired"}, p.expired),
+                ],
+                published,
+            ),
+        )
+        registry.gauge(
+            "cv_score_pending",
+            "Points waiting to be sent to the API",
+            per_stream(lambda p: [({}, p.pending())], published),
+        )
+        registry.counter(
+            "cv_score_retries_total",
+            "Failed API requests that were retried",
+            per_stream(lambda p: [({}, p.retries)], published),
+        )
+        score_seconds = registry.histogram(
+            "cv_score_publish_seconds",
+            "Time from the detected point to the API acknowledgement",
+            labelnames=("stream",),
+        )
+        for name, publisher in published:
+            publisher.on_sent = lambda seconds, name=name: score_seconds.observe(
+                seconds, stream=name
+            )
+
+    if metadata is not None:
+        registry.gauge("cv_metadata_clients", "Connected overlay metadata clients", metadata.clients)
+        registry.counter(
+            "cv_metadata_frames_total",
+            "Overlay metadata frames by outcome",
+            lambda: [
+                ({"status": "published"}, metadata.published),
+                ({"status": "dropped"}, metadata.dropped),
+            ],
+        )
+
+    if shared is not None:
+        registry.counter(
+            "cv_shared_inference_batches_total",
+            "Model calls of the shared detector",
+            lambda: shared.batches,
+        )
+        registry.counter(
+            "cv_shared_inference_frames_total",
+            "Frames run through the shared detector",
+            lambda: [({"stream": name}, n) for name, n in shared.frames.items()],
+        )
+
+    scheduled = [(s.name, s.scheduler) for s in streams if s.scheduler is not None]
+    if scheduled:
+
+        def per_scheduled(fn):
+            return per_stream(fn, scheduled)
+
+        registry.gauge(
+            "cv_inference_mode",
+            "Current adaptive inference mode (1 for the active mode)",
+            per_scheduled(lambda sch: [({"mode": mode}, int(sch.mode == mode)) for mode in MODES]),
+        )
+        registry.gauge(
+            "cv_frame_latency_seconds",
+            "Smoothed frame age at processing",
+            per_scheduled(lambda sch: [({}, sch.latency)]),
+        )
+        registry.counter(
+            "cv_inference_mode_switches_total",
+            "Adaptive mode switches",
+            per_scheduled(lambda sch: [({}, sch.switches)]),
+        )
+        registry.counter(
+            "cv_frames_by_mode_total",
+            "Frames processed in each inference mode",
+            per_scheduled(lambda sch: [({"mode": m}, n) for m, n in sch.frames_by_mode.items()]),
+        )
+        registry.counter(
+            "cv_scheduler_inferred_frames_total",
+            "Frames the adaptive scheduler sent to the detector",
+            per_scheduled(lambda sch: [({}, sch.inferred_frames)]),
+        )
+
+    return registry
+
+
+def start_staged():
+    pipeline = StagedPipeline(
+        INPUT_URL,
+        OUTPUT_URL,
+        WIDTH,
+        HEIGHT,
+        FPS,
+        model_path=MODEL_PATH,
+        corners_json=CORNERS_JSON,
+        infer_workers=INFER_WORKERS,
+        overlay_workers=OVERLAY_WORKERS,
+        queue_size=STAGE_QUEUE_SIZE,
+        batch_size=BATCH_SIZE,
+        ordered=STAGE_ORDERED,
+        reorder_window=REORDER_WINDOW,
+        pool_mb=FRAME_POOL_MB,
+        policy=FRAME_POOL_POLICY,
+        roi=DETECT_ROI,
+        roi_margin=ROI_MARGIN,
+        roi_margin_top=ROI_MARGIN_TOP,
+        table_lut=TABLE_LUT,
+        table_lut_step=TABLE_LUT_STEP,
+        pix_fmt=PIXEL_FORMAT,
+        infer_size=INFER_SIZE,
+        lean=LEAN_INFERENCE,
+        infer_threads=INFER_THREADS,
+    )
+    pipeline.start()
+    return pipeline.stop
 
 
 if __name__ == "__main__":
-    log.info("Starting pipeline threads")
-    processing_thread = threading.Thread(target=processing_loop, daemon=True)
-    processing_thread.start()
+    log.info(f"Starting pipeline ({PIPELINE})")
+    stop = start_staged() if PIPELINE == "staged" else start_threads()
 
     try:
         while True:
             time.sleep(1)
     except KeyboardInterrupt:
         log.info("Stopping pipeline")
-        input_queue.put(None)
-        output_queue.put(None)
-        reader.join()
-        writer.join()
+        stop()
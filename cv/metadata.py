@@ -0,0 +1,160 @@
+import json
+import logging
+import queue
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import numpy as np
+
+log = logging.getLogger("metadata")
+
+# Пустой комментарий SSE раз в столько секунд — держит соединение через прокси
+KEEPALIVE = 15.0
+
+
+def _to_json(value):
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def _sse(event, payload):
+    data = json.dumps(payload, separators=(",", ":"), default=_to_json)
+    return f"event: {event}\ndata: {data}\n\n".encode("utf-8")
+
+
+class MetadataHub:
+    """
+    Рассылка данных оверлея (боксы, траектория, зоны, счёт) подписчикам
+    вместо того, чтобы рисовать их в видео.
+
+    Каждый кадр сериализуется один раз. У каждого клиента своя ограниченная
+    очередь: медленный клиент теряет самые старые кадры и не тормозит
+    остальных и цикл обработки.
+    """
+
+    def __init__(self, client_queue=64):
+        self.client_queue = client_queue
+        self._clients = []
+        self._tables = {}
+        self._lock = threading.Lock()
+
+        self.published = 0
+        self.dropped = 0  # кадры, вытесненные из очередей медленных клиентов
+
+    def set_table(self, stream, corners, frame_size):
+        """Параметры стола потока: отправляются каждому новому подписчику."""
+        payload = {
+            "stream": stream,
+            "corners": np.asarray(corners).tolist(),
+            "frame_size": list(frame_size),
+        }
+        with self._lock:
+            self._tables[stream] = _sse("table", payload)
+
+    def subscribe(self, stream=None):
+        """Очередь сообщений SSE (bytes) для потока stream (None — все потоки)."""
+        q = queue.Queue(maxsize=self.client_queue)
+        with self._lock:
+            for name, message in self._tables.items():
+                if stream is None or name == stream:
+                    q.put_nowait(message)
+            self._clients.append((stream, q))
+        return q
+
+    def unsubscribe(self, q):
+        with self._lock:
+            self._clients = [(s, c) for s, c in self._clients if c is not q]
+
+    def clients(self):
+        with self._lock:
+            return len(self._clients)
+
+    def publish(self, stream, frame_no, ts, overlay):
+        """
+        Данные одного кадра. ts — время захвата по time.monotonic(),
+        клиентам уходит unix-время.
+        """
+        with self._lock:
+            clients = [q for s, q in self._clients if s is None or s == stream]
+        if not clients:
+            return
+
+        message = _sse(
+            "frame",
+            {
+                "stream": stream,
+                "frame": frame_no,
+                "ts": time.time() - (time.monotonic() - ts) if ts is not None else time.time(),
+                **overlay,
+            },
+        )
+        self.published += 1
+        for q in clients:
+            while True:
+                try:
+                    q.put_nowait(message)
+                    break
+                except queue.Full:
+                    try:
+                        q.get_nowait()
+                        self.dropped += 1
+                    except queue.Empty:
+                        pass
+
+
+class MetadataServer(threading.Thread):
+    """
+    HTTP /events — Server-Sent Events с данными оверлея из MetadataHub.
+    /events?stream=<name> — только один поток камеры.
+    """
+
+    def __init__(self, hub, port, host="0.0.0.0"):
+        super().__init__()
+        self.daemon = True
+        hub_ref = hub
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                url = urlsplit(self.path)
+                if url.path != "/events":
+                    self.send_error(404)
+                    return
+                stream = parse_qs(url.query).get("stream", [None])[0]
+
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Cache-Control", "no-cache")
+                self.send_header("Access-Control-Allow-Origin", "*")
+                self.end_headers()
+
+                q = hub_ref.subscribe(stream)
+                try:
+                    while True:
+                        try:
+                            message = q.get(timeout=KEEPALIVE)
+                        except queue.Empty:
+                            message = b": keepalive\n\n"
+                        self.wfile.write(message)
+                        self.wfile.flush()
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+                finally:
+                    hub_ref.unsubscribe(q)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+
+    def run(self):
+        log.info(f"Serving overlay metadata on :{self.server.server_address[1]}/events")
+        self.server.serve_forever()
+
+    def stop(self):
+        self.server.shutdown()
@@ -0,0 +1,104 @@
+import cv2
+import numpy as np
+from yuv import PIX_FMT_BGR, image_shape
+
+
+class MotionGate:
+    """
+    Дешёвый детектор движения над столом: разность соседних кадров по
+    уменьшенной яркости области roi=(x1, y1, x2, y2).
+
+    Пока розыгрыша нет (RallyFSM в IDLE или FINISHED, мяч не ведётся)
+    и над столом ничего не движется, plan() снимает инференс с кадров:
+    совсем (idle_every=0) или оставляет каждый idle_every-й. Кадр с движением
+    и hold следующих за ним всегда идут в модель — на первом же кадре
+    с движением инференс возобновляется.
+
+    threshold — порог разности яркости (0-255) уменьшенного изображения,
+    min_pixels — сколько пикселей должно измениться, чтобы считать движение.
+    duty_cycle — сглаженная доля кадров с инференсом.
+    """
+
+    def __init__(
+        self,
+        roi=None,
+        width=160,
+        threshold=15,
+        min_pixels=2,
+        hold=5,
+        idle_every=0,
+        alpha=0.02,
+    ):
+        self.roi = roi
+        self.width = width
+        self.threshold = threshold
+        self.min_pixels = min_pixels
+        self.hold = hold
+        self.idle_every = idle_every
+        self.alpha = alpha
+
+        self._prev = None
+        self._hold = 0
+        self._idle_no = 0
+
+        self.frames = 0
+        self.inferred = 0
+        self.gated = 0  # кадры, снятые с инференса из-за отсутствия движения
+        self.duty_cycle = 1.0
+
+    def _luma(self, frame, pix_fmt):
+        h, w = image_shape(frame, pix_fmt)
+        if self.roi is None:
+            x1, y1, x2, y2 = 0, 0, w, h
+        else:
+            x1, y1 = max(0, self.roi[0]), max(0, self.roi[1])
+            x2, y2 = min(w, self.roi[2]), min(h, self.roi[3])
+
+        # В YUV первые h строк буфера — плоскость Y, вырезка без копирования.
+        # Грубое прореживание шагом до ~2x целевой ширины, затем усреднение
+        step = max(1, (x2 - x1) // (self.width * 2))
+        crop = frame[y1:y2:step, x1:x2:step]
+        size = (self.width, max(1, round(self.width * (y2 - y1) / (x2 - x1))))
+        small = cv2.resize(crop, size, interpolation=cv2.INTER_AREA)
+        if pix_fmt == PIX_FMT_BGR:
+            small = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        return small
+
+    def motion(self, frame, pix_fmt=PIX_FMT_BGR):
+        """Есть ли движение относительно предыдущего проверенного кадра."""
+        luma = self._luma(frame, pix_fmt)
+        prev, self._prev = self._prev, luma
+        if prev is None:
+            return True
+        changed = np.count_nonzero(cv2.absdiff(luma, prev) > self.threshold)
+        return changed >= self.min_pixels
+
+    def plan(self, frames, infer, idle, pix_fmt=PIX_FMT_BGR):
+        """
+        Маска инференса для кадров батча. infer — маска, полученная
+        от планировщика; idle — нет розыгрыша на момент начала батча.
+        """
+        if not idle:
+            # Во время розыгрыша движение не проверяется, опорный кадр
+            # устарел бы — первый кадр после розыгрыша всегда идёт в модель
+            self._prev = None
+            self._hold = 0
+        else:
+            infer = list(infer)
+            for i, frame in enumerate(frames):
+                if not infer[i]:
+                    continue
+                if self.motion(frame, pix_fmt):
+                    self._hold = self.hold
+                elif self._hold > 0:
+                    self._hold -= 1
+                else:
+                    infer[i] = bool(self.idle_every) and self._idle_no % self.idle_every == 0
+                    self._idle_no += 1
+                    self.gated += not infer[i]
+
+        for flag in infer:
+            self.duty_cycle += self.alpha * (flag - self.duty_cycle)
+        self.frames += len(infer)
+        self.inferred += sum(infer)
+        return infer
@@ -0,0 +1,382 @@
+import logging
+import multiprocessing as mp
+import queue
+import threading
+
+from frame_pool import POLICY_BLOCK, FramePool
+from reader import RTSPReader
+from yuv import PIX_FMT_BGR
+
+log = logging.getLogger("pipeline")
+
+
+class ReorderBuffer:
+    """
+    Выдаёт элементы строго по возрастанию seq.
+
+    Если пропуск не заполняется, пока в буфере больше window элементов,
+    считаем кадр потерянным и перескакиваем через него. Кадр, пришедший
+    после такого перескока, уже не выдаётся: push() возвращает None,
+    освободить его слот пула должен вызывающий.
+    """
+
+    def __init__(self, window=64):
+        self.window = window
+        self.next_seq = 0
+        self.pending = {}
+        self.skipped = 0
+        self.late = 0
+
+    def push(self, seq, item):
+        if seq < self.next_seq:
+            self.late += 1
+            log.warning(f"Frame {seq} arrived after being skipped — dropping")
+            return None
+        self.pending[seq] = item
+        ready = []
+        while True:
+            if self.next_seq in self.pending:
+                ready.append((self.next_seq, self.pending.pop(self.next_seq)))
+                self.next_seq += 1
+            elif len(self.pending) > self.window:
+                nxt = min(self.pending)
+                self.skipped += nxt - self.next_seq
+                log.warning(f"Reorder window exceeded — skipping frames {self.next_seq}..{nxt - 1}")
+                self.next_seq = nxt
+            else:
+                return ready
+
+
+def _drain(q, first, limit):
+    """Добирает из очереди до limit элементов без ожидания. Второе значение — встретился стоп."""
+    batch = [first]
+    while len(batch) < limit:
+        try:
+            item = q.get_nowait()
+        except queue.Empty:
+            break
+        if item is None:
+            return batch, True
+        batch.append(item)
+    return batch, False
+
+
+# ------------------------------
+# Стадии, работающие в отдельных процессах
+# ------------------------------
+
+
+def infer_worker(
+    model_path, conf, iou, pool, in_q, out_q, batch_size, roi=None, lean=False, threads=0
+):
+    logging.basicConfig(level=logging.INFO)
+    from tt_processor import detect_frames, make_detector
+
+    detector = make_detector(model_path, conf, iou, lean, threads)
+    while True:
+        item = in_q.get()
+        if item is None:
+            break
+
+        batch, stop = _drain(in_q, item, batch_size)
+        try:
+            if pool.infer_shape is None:
+                frames = [pool.view(idx) for _, idx in batch]
+                detections = detect_frames(detector, frames, roi, pool.pix_fmt)
+            else:
+                ih, iw = pool.infer_shape[:2]
+                frames = [pool.view_infer(idx) for _, idx in batch]
+                scale = (pool.width / iw, pool.height / ih)
+                detections = detect_frames(detector, frames, roi, scale=scale)
+        except Exception as e:
+            log.error(f"Inference error: {e}, forwarding raw frames")
+            detections = [None] * len(batch)
+
+        for (seq, idx), dets in zip(batch, detections):
+            out_q.put((seq, idx, dets))
+        if stop:
+            break
+
+    out_q.put(None)
+
+
+def overlay_worker(src_corners, pool, in_q, out_q):
+    logging.basicConfig(level=logging.INFO)
+    from tt_processor import draw_overlay
+
+    while True:
+        item = in_q.get()
+        if item is None:
+            break
+
+        seq, idx, overlay = item
+        if overlay is not None:
+            try:
+                draw_overlay(pool.view(idx), overlay, src_corners, pool.pix_fmt)
+            except Exception as e:
+                log.error(f"Overlay error: {e}, forwarding raw frame")
+        out_q.put((seq, idx))
+
+    out_q.put(None)
+
+
+def encode_worker(
+    pool, in_q, output_url, width, height, fps, producers, ordered, window, max_delay=None
+):
+    logging.basicConfig(level=logging.INFO)
+    from writer import RTSPWriter
+
+    frames = queue.Queue(maxsize=2)
+    writer = RTSPWriter(
+        frames,
+        output_url,
+        width,
+        height,
+        fps,
+        pool=pool,
+        pix_fmt=pool.pix_fmt,
+        max_delay=max_delay,
+    )
+    writer.start()
+
+    reorder = ReorderBuffer(window) if ordered else None
+    finished = 0
+    while finished < producers:
+        item = in_q.get()
+        if item is None:
+            finished += 1
+            continue
+
+        seq, idx = item
+        ready = reorder.push(seq, idx) if reorder else [(seq, idx)]
+        if ready is None:
+            pool.release(idx)
+            continue
+        for _, ready_idx in ready:
+            frames.put(ready_idx)
+
+    frames.put(None)
+    writer.join()
+
+
+# ------------------------------
+# Конвейер
+# ------------------------------
+
+
+class StagedPipeline:
+    """
+    Многопроцессный конвейер: decode -> infer -> logic -> overlay -> encode.
+
+    Кадры лежат в общем FramePool (SharedMemory), между стадиями по
+    ограниченным multiprocessing.Queue ходят только (seq, индекс слота)
+    и детекции/данные для отрисовки.
+
+    - decode: RTSPReader в основном процессе, нумерует кадры
+    - infer: infer_workers процессов с моделью, порядок выхода не гарантирован
+    - logic: поток в основном процессе, восстанавливает порядок по seq —
+      игровая логика обязана видеть кадры строго последовательно
+    - overlay: overlay_workers процессов, рисуют прямо в слотах пула
+    - encode: процесс с RTSPWriter; ordered=True — восстанавливает порядок перед ffmpeg
+
+    pix_fmt — формат кадров в пуле от decode до encode (см. yuv.PIX_FMTS).
+    infer_size=(w, h) — decode отдаёт ещё и уменьшенные кадры, infer работает на них.
+    lean, infer_threads — инференс через LeanDetector (см. tt_processor.make_detector).
+    """
+
+    def __init__(
+        self,
+        input_url,
+        output_url,
+        width,
+        height,
+        fps,
+        model_path,
+        corners_json,
+        conf=0.2,
+        iou=0.7,
+        infer_workers=1,
+        overlay_workers=1,
+        queue_size=16,
+        batch_size=4,
+        ordered=True,
+        reorder_window=64,
+        pool_mb=512,
+        policy=POLICY_BLOCK,
+        roi=False,
+        roi_margin=0.15,
+        roi_margin_top=0.6,
+        table_lut=False,
+        table_lut_step=1,
+        pix_fmt=PIX_FMT_BGR,
+        infer_size=None,
+        lean=False,
+        infer_threads=0,
+    ):
+        from tt_processor import TableTennisProcessor
+
+        self.ctx = mp.get_context("spawn")
+        self.infer_workers = infer_workers
+        self.overlay_workers = overlay_workers
+        self.reorder_window = reorder_window
+
+        # Слоты: все очереди стадий + кадры в работе у каждого воркера + удерживаемый writer'ом
+        slots = 5 * queue_size + batch_size * infer_workers + overlay_workers + 4
+        self.pool = FramePool(
+            width,
+            height,
+            slots=slots,
+            max_bytes=pool_mb * 1024 * 1024,
+            shared=True,
+            mp_context=self.ctx,
+            pix_fmt=pix_fmt,
+            infer_size=infer_size,
+        )
+
+        # Процессор без модели: только игровая логика по готовым детекциям
+        self.processor = TableTennisProcessor(
+            None,
+            corners_json,
+            conf,
+            iou,
+            roi=roi,
+            roi_margin=roi_margin,
+            roi_margin_top=roi_margin_top,
+            table_lut=table_lut,
+            table_lut_step=table_lut_step,
+            frame_size=(width, height),
+            pix_fmt=pix_fmt,
+        )
+
+        self.decoded_q = queue.Queue(maxsize=queue_size)
+        self.infer_q = self.ctx.Queue(maxsize=queue_size)
+        self.logic_q = self.ctx.Queue(maxsize=queue_size)
+        self.overlay_q = self.ctx.Queue(maxsize=queue_size)
+        self.encode_q = self.ctx.Queue(maxsize=queue_size)
+
+        self.reader = RTSPReader(
+            input_url,
+            width,
+            height,
+            fps,
+            self.decoded_q,
+            pool=self.pool,
+            policy=policy,
+            pix_fmt=pix_fmt,
+        )
+
+        self.processes = [
+            self.ctx.Process(
+                target=infer_worker,
+                args=(
+                    model_path,
+                    conf,
+                    iou,
+                    self.pool,
+                    self.infer_q,
+                    self.logic_q,
+                    batch_size,
+                    self.processor.roi,
+                    lean,
+                    infer_threads,
+                ),
+                name=f"infer-{i}",
+                daemon=True,
+            )
+            for i in range(infer_workers)
+        ]
+        self.processes += [
+            self.ctx.Process(
+                target=overlay_worker,
+                args=(self.processor.src_corners, self.pool, self.overlay_q, self.encode_q),
+                name=f"overlay-{i}",
+                daemon=True,
+            )
+            for i in range(overlay_workers)
+        ]
+        self.processes.append(
+            self.ctx.Process(
+                target=encode_worker,
+                args=(
+                    self.pool,
+                    self.encode_q,
+                    output_url,
+                    width,
+                    height,
+                    fps,
+                    overlay_workers,
+                    ordered,
+                    reorder_window,
+                    # Кадры приходят пачками по батчу инференса
+                    (batch_size + 1) / fps,
+                ),
+                name="encode",
+                daemon=True,
+            )
+        )
+
+        self.threads = [
+            threading.Thread(target=self._dispatch_loop, name="dispatch", daemon=True),
+            threading.Thread(target=self._logic_loop, name="logic", daemon=True),
+        ]
+
+    def start(self):
+        for p in self.processes:
+            p.start()
+        for t in self.threads:
+            t.start()
+        self.reader.start()
+
+    def stop(self, timeout=5):
+        # Сначала decode: после него в пул и очереди никто не пишет
+        self.reader.stop()
+        self.reader.join(timeout)
+        self.decoded_q.put(None)
+        for t in self.threads:
+            t.join(timeout)
+        for p in self.processes:
+            p.join(timeout)
+            if p.is_alive():
+                p.terminate()
+        self.pool.close()
+
+    def _dispatch_loop(self):
+        # Нумерация кадров — по ней стадии восстанавливают порядок
+        seq = 0
+        while True:
+            idx = self.decoded_q.get()
+            if idx is None:
+                break
+            self.infer_q.put((seq, idx))
+            seq += 1
+
+        for _ in range(self.infer_workers):
+            self.infer_q.put(None)
+
+    def _logic_loop(self):
+        reorder = ReorderBuffer(self.reorder_window)
+        finished = 0
+        while finished < self.infer_workers:
+            item = self.logic_q.get()
+            if item is None:
+                finished += 1
+                continue
+
+            seq, idx, dets = item
+            ready = reorder.push(seq, (idx, dets))
+            if ready is None:
+                self.pool.release(idx)
+                continue
+            for ready_seq, (ready_idx, ready_dets) in ready:
+                overlay = None
+                if ready_dets is not None:
+                    try:
+                        overlay = self.processor.update(
+                            ready_dets, self.pool.timestamp(ready_idx)
+                        )
+                    except Exception as e:
+                        log.error(f"Game logic error: {e}, forwarding raw frame")
+                self.overlay_q.put((ready_seq, ready_idx, overlay))
+
+        for _ in range(self.overlay_workers):
+            self.overlay_q.put(None)
@@ -1,14 +1,31 @@
 # reader.py
+import os
 import subprocess
 import threading
+import time
 import queue
 import logging
 import numpy as np
 
+from frame_pool import POLICY_BLOCK, POLICY_DROP, read_exact_into
+from yuv import PIX_FMT_BGR, frame_shape
+
 log = logging.getLogger("reader")
 
 class RTSPReader(threading.Thread):
-    def __init__(self, url, width, height, fps, output_queue, queue_size=60):
+    def __init__(
+        self,
+        url,
+        width,
+        height,
+        fps,
+        output_queue,
+        queue_size=60,
+        pool=None,
+        policy=POLICY_DROP,
+        pix_fmt=PIX_FMT_BGR,
+        clock_tolerance=0.5,
+    ):
         super().__init__()
         self.url = url
         self.width = width
@@ -16,28 +33,162 @@ class RTSPReader(threading.Thread):
         self.fps = fps
         self.output_queue = output_queue
         self.queue_size = queue_size
+        # Если задан пул, в очередь уходят индексы слотов, а не кадры
+        self.pool = pool
+        if policy not in (POLICY_BLOCK, POLICY_DROP):
+            raise ValueError(f"Unknown frame pool policy: {policy}")
+        self.policy = policy
+        # Формат кадров на выходе ffmpeg: yuv420p/nv12 — вдвое меньше байт через pipe
+        self.pix_fmt = pix_fmt
+        self.frame_shape = frame_shape(width, height, pix_fmt)
+        # Пул с infer_size — ffmpeg за одно декодирование отдаёт ещё и уменьшенный
+        # BGR-кадр для детектора (во второй pipe, кадр в кадр с основным)
+        self.infer_shape = pool.infer_shape if pool is not None else None
+        self._infer_stream = None
+        # Отброшенные кадры по причинам
+        self.dropped = {"pool_exhausted": 0, "queue_full": 0}
         self.proc = None
         self.daemon = True
+        self._stopped = threading.Event()
+        # Время кадра — по номеру кадра от опорной точки: кадры из pipe приходят
+        # пачками, и время чтения не годится как время захвата. Если оценка
+        # разошлась с часами больше clock_tolerance (потери, другой fps) —
+        # опорная точка переносится на текущий кадр. Назад часы не идут: если
+        # оценка убежала вперёд, метки растут на полкадра за кадр, пока
+        # часы не догонят, — монотонно, но без бесконечного ухода вперёд
+        self.clock_tolerance = clock_tolerance
+        self._clock_base = None
+        self._clock_frames = 0
+        self._last_ts = None
 
-    def run(self):
+    def _command(self, infer_fd=None):
         cmd = [
             "ffmpeg",
             "-rtsp_transport", "tcp",
             "-i", self.url,
-            "-f", "rawvideo",
-            "-pix_fmt", "bgr24",
-            "-s", f"{self.width}x{self.height}",
-            "-"
         ]
-        self.proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        frame_size = self.width * self.height * 3
+        if infer_fd is None:
+            return cmd + [
+                "-f", "rawvideo",
+                "-pix_fmt", self.pix_fmt,
+                "-s", f"{self.width}x{self.height}",
+                "-",
+            ]
+
+        ih, iw = self.infer_shape[:2]
+        return cmd + [
+            "-filter_complex",
+            f"[0:v]split=2[full][low];[full]scale={self.width}:{self.height}[out];"
+            f"[low]scale={iw}:{ih}[det]",
+            "-map", "[out]", "-f", "rawvideo", "-pix_fmt", self.pix_fmt, "pipe:1",
+            "-map", "[det]", "-f", "rawvideo", "-pix_fmt", "bgr24", f"pipe:{infer_fd}",
+        ]
+
+    def run(self):
+        if self.infer_shape is None:
+            self.proc = subprocess.Popen(
+                self._command(), stdout=subprocess.PIPE, stderr=subprocess.PIPE
+            )
+        else:
+            read_fd, write_fd = os.pipe()
+            self.proc = subprocess.Popen(
+                self._command(write_fd),
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                pass_fds=(write_fd,),
+            )
+            os.close(write_fd)
+            self._infer_stream = os.fdopen(read_fd, "rb")
+        # stop() мог прийти раньше, чем ffmpeg запустился
+        if self._stopped.is_set():
+            self.proc.terminate()
+
+        try:
+            if self.pool is not None:
+                self._run_pooled()
+            else:
+                self._run_frames()
+        finally:
+            self._close()
+
+    def _close(self):
+        # Закрываются только в потоке чтения — stop() лишь завершает ffmpeg,
+        # чтобы не закрыть pipe посреди read()
+        if self.proc.poll() is None:
+            self.proc.terminate()
+        self.proc.stdout.close()
+        self.proc.stderr.close()
+        if self._infer_stream is not None:
+            self._infer_stream.close()
+            self._infer_stream = None
+        self.proc.wait()
+
+    def _run_frames(self):
+        frame_size = int(np.prod(self.frame_shape))
         while True:
             raw_frame = self.proc.stdout.read(frame_size)
             if len(raw_frame) != frame_size:
                 log.warning("EOF or broken frame")
                 break
-            frame = np.frombuffer(raw_frame, np.uint8).reshape((self.height, self.width, 3))
+            frame = np.frombuffer(raw_frame, np.uint8).reshape(self.frame_shape)
             try:
                 self.output_queue.put_nowait(frame)
             except queue.Full:
+                self.dropped["queue_full"] += 1
+                log.warning("Input queue full — dropping frame")
+
+    def _timestamp(self):
+        now = time.monotonic()
+        ts = None
+        if self._clock_base is not None:
+            ts = self._clock_base + self._clock_frames / self.fps
+        if ts is None or abs(now - ts) > self.clock_tolerance:
+            if self._last_ts is not None:
+                now = max(now, self._last_ts + 0.5 / self.fps)
+            self._clock_base, self._clock_frames, ts = now, 0, now
+        self._clock_frames += 1
+        self._last_ts = ts
+        return ts
+
+    def stop(self):
+        self._stopped.set()
+        if self.proc is not None and self.proc.poll() is None:
+            self.proc.terminate()
+
+    def _run_pooled(self):
+        # Буфер для вычитывания кадров, которые некуда положить:
+        # ffmpeg нельзя останавливать, иначе он начнёт копить задержку
+        scratch = np.empty(self.frame_shape, dtype=np.uint8)
+        if self.infer_shape is not None:
+            infer_scratch = np.empty(self.infer_shape, dtype=np.uint8)
+
+        while True:
+            idx = self.pool.acquire(block=self.policy == POLICY_BLOCK)
+            target = scratch if idx is None else self.pool.view(idx)
+
+            ok = read_exact_into(self.proc.stdout, target)
+            if ok and self._infer_stream is not None:
+                infer_target = infer_scratch if idx is None else self.pool.view_infer(idx)
+                ok = read_exact_into(self._infer_stream, infer_target)
+
+            if not ok:
+                log.warning("EOF or broken frame")
+                if idx is not None:
+                    self.pool.release(idx)
+                break
+
+            # Часы считают и отброшенные кадры — они тоже занимали место в потоке
+            ts = self._timestamp()
+            if idx is None:
+                self.dropped["pool_exhausted"] += 1
+                log.warning("Frame pool exhausted — dropping frame")
+                continue
+
+            self.pool.stamp(idx, ts)
+
+            try:
+                self.output_queue.put(idx, block=self.policy == POLICY_BLOCK)
+            except queue.Full:
+                self.pool.release(idx)
+                self.dropped["queue_full"] += 1
                 log.warning("Input queue full — dropping frame")
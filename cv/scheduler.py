@@ -0,0 +1,96 @@
+import logging
+import time
+
+log = logging.getLogger("scheduler")
+
+MODE_FULL = "full"  # инференс на каждом кадре
+MODE_SKIP = "skip"  # инференс на каждом N-м кадре, между ними — интерполяция трекером
+MODE_DETECT_ONLY = "detect_only"  # инференс на каждом N-м кадре, без отрисовки
+
+MODES = (MODE_FULL, MODE_SKIP, MODE_DETECT_ONLY)
+
+
+class InferenceScheduler:
+    """
+    Выбирает режим обработки по задержке конвейера.
+
+    Задержка — сглаженный возраст кадра в момент, когда он забирается на
+    обработку, плюс заполненность входной очереди. Если задержка выше
+    target_latency (или очередь заполнена выше high_watermark), режим
+    становится дешевле на одну ступень; если ниже target_latency * recover_ratio
+    и очередь почти пуста — дороже. Между переключениями не меньше min_dwell секунд.
+    """
+
+    def __init__(
+        self,
+        target_latency=0.5,
+        skip_every=3,
+        queue_size=60,
+        high_watermark=0.75,
+        recover_ratio=0.5,
+        min_dwell=2.0,
+        alpha=0.2,
+    ):
+        self.target_latency = target_latency
+        self.skip_every = skip_every
+        self.queue_size = queue_size
+        self.high_watermark = high_watermark
+        self.recover_ratio = recover_ratio
+        self.min_dwell = min_dwell
+        self.alpha = alpha
+
+        self.mode = MODE_FULL
+        self.latency = 0.0
+        self.queue_depth = 0
+        self.switches = 0
+        self.frames_by_mode = {mode: 0 for mode in MODES}
+        self.inferred_frames = 0
+        self._changed_at = time.monotonic()
+        self._frame_no = 0
+
+    def observe(self, queue_depth, frame_age, now=None):
+        now = time.monotonic() if now is None else now
+
+        self.latency = self.alpha * frame_age + (1 - self.alpha) * self.latency
+        self.queue_depth = queue_depth
+        fill = queue_depth / self.queue_size if self.queue_size else 0.0
+
+        if now - self._changed_at < self.min_dwell:
+            return self.mode
+
+        overloaded = self.latency > self.target_latency or fill > self.high_watermark
+        relaxed = (
+            self.latency < self.target_latency * self.recover_ratio
+            and fill < self.high_watermark / 2
+        )
+
+        level = MODES.index(self.mode)
+        if overloaded and level < len(MODES) - 1:
+            self._switch(MODES[level + 1], now, fill)
+        elif relaxed and level > 0:
+            self._switch(MODES[level - 1], now, fill)
+
+        return self.mode
+
+    def _switch(self, mode, now, fill):
+        log.warning(
+            f"Inference mode {self.mode} -> {mode} "
+            f"(latency {self.latency:.2f}s, queue {self.queue_depth}, fill {fill:.0%})"
+        )
+        self.mode = mode
+        self.switches += 1
+        self._changed_at = now
+
+    def plan(self, n):
+        """
+        Маски (infer, overlays) для следующих n кадров в текущем режиме.
+        """
+        infer = []
+        for _ in range(n):
+            infer.append(self.mode == MODE_FULL or self._frame_no % self.skip_every == 0)
+            self.frames_by_mode[self.mode] += 1
+            self._frame_no += 1
+
+        self.inferred_frames += sum(infer)
+        overlays = self.mode != MODE_DETECT_ONLY
+        return infer, overlays
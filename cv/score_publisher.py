@@ -0,0 +1,179 @@
+import http.client
+import logging
+import queue
+import threading
+import time
+import uuid
+from urllib.parse import urlencode, urlsplit
+
+log = logging.getLogger("score_publisher")
+
+UPDATE_PATH = "/api/v1/session/update/{player}"
+# Больше очков в одном запросе API не принимает (422)
+MAX_COUNT = 50
+
+
+def coalesce(events, max_count=MAX_COUNT):
+    """
+    Подряд идущие очки одного игрока -> один запрос (не больше max_count очков).
+    events — [(seq, player, ts)] по возрастанию seq; результат —
+    [(seq последнего, player, count, ts первого)].
+    """
+    groups = []
+    for seq, player, ts in events:
+        if groups and groups[-1][1] == player and groups[-1][2] < max_count:
+            _, _, count, first_ts = groups[-1]
+            groups[-1] = (seq, player, count + 1, first_ts)
+        else:
+            groups.append((seq, player, 1, ts))
+    return groups
+
+
+class ScorePublisher(threading.Thread):
+    """
+    Отправляет выигранные очки в API (POST /api/v1/session/update/{player})
+    из отдельного потока: publish() только кладёт событие в очередь и никогда
+    не блокирует цикл обработки кадров.
+
+    События нумеруются (seq) в пределах источника source — уникального
+    для каждого запуска. Всё, что накопилось, пока API отвечал медленно,
+    уходит одной пачкой: подряд идущие очки одного игрока — одним запросом
+    с count. Неудачный запрос повторяется с теми же seq/count, API
+    пропускает уже применённые события, так что очко не начисляется дважды.
+    Соединение одно и переиспользуется (keep-alive).
+
+    max_age — сколько секунд пытаться доставить очко; дольше табло всё равно
+    разойдётся с игрой, а очередь не должна стоять из-за одного события.
+    """
+
+    def __init__(
+        self,
+        api_url,
+        source=None,
+        queue_size=1024,
+        timeout=2.0,
+        retry_delay=0.5,
+        max_retry_delay=5.0,
+        max_age=30.0,
+    ):
+        super().__init__(name="score-publisher", daemon=True)
+        url = urlsplit(api_url)
+        if url.scheme not in ("http", "https"):
+            raise ValueError(f"Unsupported API URL: {api_url}")
+        self._conn_cls = (
+            http.client.HTTPSConnection if url.scheme == "https" else http.client.HTTPConnection
+        )
+        self._netloc = url.netloc
+        self._prefix = url.path.rstrip("/")
+        self.source = source or uuid.uuid4().hex[:12]
+        self.timeout = timeout
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self.max_age = max_age
+
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._seq = 0
+        self._conn = None
+        self._stopped = threading.Event()
+
+        self.sent = 0  # очки, подтверждённые API
+        self.requests = 0
+        self.retries = 0
+        self.dropped = 0  # очередь переполнена
+        self.expired = 0  # не доставлены за max_age или отклонены API
+        # on_sent(seconds) — от события до подтверждения API
+        self.on_sent = None
+
+    def publish(self, player):
+        """Очко игроку 1 или 2 (LEFT/RIGHT). Не блокирует."""
+        self._seq += 1
+        try:
+            self._queue.put_nowait((self._seq, player, time.monotonic()))
+        except queue.Full:
+            self.dropped += 1
+            log.error(f"Score queue full — point for player {player} not published")
+
+    def on_event(self, event, side, winner):
+        """Колбэк для TableTennisProcessor.on_event."""
+        if winner:
+            self.publish(winner)
+
+    def pending(self):
+        return self._queue.qsize()
+
+    def stop(self):
+        self._stopped.set()
+        try:
+            self._queue.put_nowait(None)
+        except queue.Full:
+            pass
+
+    def _drain(self, first):
+        events = [first]
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                self._stopped.set()
+                break
+            events.append(item)
+        return events
+
+    def _post(self, seq, player, count):
+        if self._conn is None:
+            self._conn = self._conn_cls(self._netloc, timeout=self.timeout)
+        params = urlencode({"seq": seq, "count": count, "source": self.source})
+        path = f"{self._prefix}{UPDATE_PATH.format(player=player)}?{params}"
+        try:
+            self._conn.request("POST", path)
+            response = self._conn.getresponse()
+            response.read()
+        except (OSError, http.client.HTTPException):
+            self._conn.close()
+            self._conn = None
+            raise
+        self.requests += 1
+        if response.status >= 500:
+            raise http.client.HTTPException(f"API responded {response.status}")
+        return response.status < 400
+
+    def _send(self, group):
+        seq, player, count, ts = group
+        delay = self.retry_delay
+        while True:
+            try:
+                if self._post(seq, player, count):
+                    break
+                # 4xx — повтор не поможет (нет активного матча, неверный запрос)
+                log.warning(f"API rejected {count} point(s) for player {player}")
+                self.expired += count
+                return
+            except (OSError, http.client.HTTPException) as e:
+                if self._stopped.is_set():
+                    log.warning(f"Score publisher stopped, {count} point(s) not confirmed")
+                    return
+                if time.monotonic() - ts > self.max_age:
+                    log.error(f"Giving up on {count} point(s) for player {player}: {e}")
+                    self.expired += count
+                    return
+                self.retries += 1
+                log.warning(f"Score publish failed: {e}, retrying in {delay:.1f}s")
+                time.sleep(delay)
+                delay = min(delay * 2, self.max_retry_delay)
+
+        self.sent += count
+        if self.on_sent is not None:
+            self.on_sent(time.monotonic() - ts)
+
+    def run(self):
+        while not self._stopped.is_set():
+            item = self._queue.get()
+            if item is None:
+                break
+            for group in coalesce(self._drain(item)):
+                self._send(group)
+
+        if self._conn is not None:
+            self._conn.close()
@@ -0,0 +1,167 @@
+import logging
+import threading
+import time
+from collections import deque
+
+log = logging.getLogger("shared_inference")
+
+
+class _Request:
+    __slots__ = ("frames", "rois", "done", "result", "error")
+
+    def __init__(self, frames, rois):
+        self.frames = frames
+        self.rois = rois
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class DetectorClient:
+    """
+    Detector для одного потока: detect() с тем же контрактом, что и
+    tt_processor.Detector, но кадры уходят в общий SharedDetector.
+    """
+
+    def __init__(self, shared, name):
+        self.shared = shared
+        self.name = name
+
+    def detect(self, frames, roi=None):
+        frames = list(frames)
+        rois = roi if isinstance(roi, list) else [roi] * len(frames)
+        request = _Request(frames, rois)
+        self.shared._submit(self.name, request)
+        request.done.wait()
+        if request.error is not None:
+            raise request.error
+        return request.result
+
+
+class SharedDetector(threading.Thread):
+    """
+    Одна модель на несколько потоков камер.
+
+    Потоки получают DetectorClient через client(name) и вызывают detect()
+    как обычно; запросы всех потоков склеиваются в один вызов модели до
+    max_batch кадров. Потоки обходятся по кругу (по запросу от каждого за
+    круг, начало круга сдвигается), так что частый поток не вытесняет
+    остальные. Запрос не делится между вызовами модели.
+
+    max_wait — сколько ждать запросы других потоков, если в батче пока
+    один поток (секунды).
+    """
+
+    def __init__(self, detector, max_batch=8, max_wait=0.005):
+        super().__init__(name="shared-inference", daemon=True)
+        self.detector = detector
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+
+        self._pending = {}
+        self._order = []
+        self._next = 0
+        self._cond = threading.Condition()
+        self._stopped = False
+
+        self.batches = 0
+        self.frames = {}  # кадры по потокам
+
+    def client(self, name):
+        with self._cond:
+            if name in self._pending:
+                raise ValueError(f"Stream {name} is already registered")
+            self._pending[name] = deque()
+            self._order.append(name)
+            self.frames[name] = 0
+        return DetectorClient(self, name)
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+
+    def _submit(self, name, request):
+        with self._cond:
+            if self._stopped:
+                request.error = RuntimeError("Shared detector is stopped")
+                request.done.set()
+                return
+            self._pending[name].append(request)
+            self._cond.notify_all()
+
+    def _waiting_streams(self):
+        return sum(1 for q in self._pending.values() if q)
+
+    def _take(self):
+        """Следующий батч запросов [(name, request)] по кругу потоков."""
+        with self._cond:
+            while not self._stopped and not self._waiting_streams():
+                self._cond.wait()
+            if self._stopped:
+                return None
+
+            # Даём другим потокам успеть со своими кадрами
+            deadline = time.monotonic() + self.max_wait
+            while (
+                self._waiting_streams() < len(self._order)
+                and sum(len(r.frames) for q in self._pending.values() for r in q) < self.max_batch
+            ):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not self._cond.wait(remaining):
+                    break
+
+            taken, size = [], 0
+            n = len(self._order)
+            while size < self.max_batch:
+                progress = False
+                for k in range(n):
+                    name = self._order[(self._next + k) % n]
+                    q = self._pending[name]
+                    if not q or (taken and size + len(q[0].frames) > self.max_batch):
+                        continue
+                    request = q.popleft()
+                    taken.append((name, request))
+                    size += len(request.frames)
+                    progress = True
+                if not progress:
+                    break
+            self._next = (self._next + 1) % n
+            return taken
+
+    def run(self):
+        while True:
+            taken = self._take()
+            if taken is None:
+                break
+
+            frames, rois = [], []
+            for _, request in taken:
+                frames += request.frames
+                rois += request.rois
+
+            try:
+                detections = self.detector.detect(frames, roi=rois)
+            except Exception as e:
+                log.error(f"Shared inference error: {e}")
+                for _, request in taken:
+                    request.error = e
+                    request.done.set()
+                continue
+
+            self.batches += 1
+            offset = 0
+            for name, request in taken:
+                n = len(request.frames)
+                request.result = detections[offset : offset + n]
+                offset += n
+                self.frames[name] += n
+                request.done.set()
+
+        # Разбудить тех, кто ещё ждёт
+        with self._cond:
+            for q in self._pending.values():
+                while q:
+                    request = q.popleft()
+                    request.error = RuntimeError("Shared detector is stopped")
+                    request.done.set()
@@ -221,7 +221,7 @@ while cap.isOpened():
 
                 mx, my = int(mapped_pt[0]), int(mapped_pt[1])
 
-                ball_state.update(mx, my)
+                ball_state.update(mx, my, cap.get(cv2.CAP_PROP_POS_MSEC) / 1000)
                 event = detect_event(ball_state, mx, my)
                 # Определяем сторону мяча
                 side = side_of_table(mx)
@@ -0,0 +1,131 @@
+import logging
+import os
+import tempfile
+import zipfile
+from pathlib import Path
+
+import cv2
+import numpy as np
+from game_logic import MID_X, MID_Y
+
+log = logging.getLogger("table_lut")
+
+# umask процесса: узнать его можно только сменив, поэтому — один раз при импорте
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+
+def map_to_table(points, H):
+    """Пиксели кадра (N, 2) -> координаты стола (N, 2) одним вызовом."""
+    pts = np.asarray(points, dtype=np.float32).reshape(-1, 1, 2)
+    if len(pts) == 0:
+        return np.empty((0, 2), dtype=np.float32)
+    return cv2.perspectiveTransform(pts, H).reshape(-1, 2)
+
+
+# Зоны get_zone по индексу (x >= MID_X) + 2 * (y >= MID_Y)
+_ZONES = np.array([3, 1, 4, 2], dtype=np.uint8)
+
+
+def zones_of(table_points):
+    """Векторный get_zone: координаты стола (N, 2) -> зоны (N,)."""
+    return _ZONES[(table_points[:, 0] >= MID_X) + 2 * (table_points[:, 1] >= MID_Y)]
+
+
+def lut_path(corners_json):
+    """Файл таблицы рядом с JSON углов стола: table_corners.json -> table_corners.lut.npz."""
+    return Path(corners_json).with_suffix(".lut.npz")
+
+
+class TableLUT:
+    """
+    Предрасчитанная таблица пиксель кадра -> координаты стола и зона.
+
+    Значения хранятся в узлах сетки с шагом step пикселей, точка берёт
+    ближайший узел (ошибка — до step / 2 пикселя кадра; step=1 — точно,
+    но ~18 МБ на 1080p). Таблица строится один раз по гомографии
+    и сохраняется в .npz, чтобы после перезапуска или в другом процессе
+    её можно было просто загрузить.
+    """
+
+    def __init__(self, coords, zones, step, H, frame_size):
+        self.coords = coords
+        self.zones = zones
+        self.step = step
+        self.H = H
+        self.frame_size = tuple(frame_size)
+
+    @classmethod
+    def build(cls, H, frame_size, step=1):
+        w, h = frame_size
+        xs = np.arange(0, w - 1 + step, step, dtype=np.float32)
+        ys = np.arange(0, h - 1 + step, step, dtype=np.float32)
+        grid = np.stack(np.meshgrid(xs, ys), axis=-1)
+
+        coords = map_to_table(grid.reshape(-1, 2), H)
+        zones = zones_of(coords).reshape(len(ys), len(xs))
+        return cls(coords.reshape(len(ys), len(xs), 2), zones, step, H, frame_size)
+
+    def save(self, path):
+        # Через временный файл рядом и os.replace: прерванная запись или
+        # параллельная сборка другим потоком не оставят битую таблицу
+        path = Path(path)
+        fd, tmp = tempfile.mkstemp(prefix=f".{path.name}.", suffix=".tmp", dir=path.parent)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                np.savez_compressed(
+                    f,
+                    coords=self.coords,
+                    zones=self.zones,
+                    step=self.step,
+                    H=self.H,
+                    frame_size=np.array(self.frame_size),
+                )
+            # mkstemp создаёт файл с правами 0600 — таблицу на общем томе
+            # не смогли бы прочитать другие пользователи и контейнеры
+            os.chmod(tmp, 0o666 & ~_UMASK)
+            os.replace(tmp, path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as f:
+            return cls(f["coords"], f["zones"], int(f["step"]), f["H"], f["frame_size"].tolist())
+
+    @classmethod
+    def load_or_build(cls, path, H, frame_size, step=1):
+        """
+        Загружает таблицу, если она построена для той же гомографии,
+        размера кадра и шага; иначе строит заново и сохраняет.
+        """
+        path = Path(path)
+        if path.exists():
+            try:
+                lut = cls.load(path)
+                if (
+                    lut.step == step
+                    and lut.frame_size == tuple(frame_size)
+                    and np.allclose(lut.H, H)
+                ):
+                    return lut
+                log.info(f"Table LUT {path} is stale, rebuilding")
+            except (OSError, ValueError, KeyError, EOFError, zipfile.BadZipFile) as e:
+                log.warning(f"Could not load table LUT {path}: {e}, rebuilding")
+
+        lut = cls.build(H, frame_size, step)
+        try:
+            lut.save(path)
+            log.info(f"Table LUT saved to {path} ({lut.coords.nbytes / 1e6:.1f} MB)")
+        except OSError as e:
+            log.warning(f"Could not save table LUT {path}: {e}")
+        return lut
+
+    def lookup(self, points):
+        """Пиксели кадра (N, 2) -> (координаты стола (N, 2), зоны (N,))."""
+        rows, cols = self.zones.shape
+        idx = np.rint(np.asarray(points).reshape(-1, 2) / self.step)
+        idx = np.clip(idx, 0, (cols - 1, rows - 1)).astype(np.intp)
+        ix, iy = idx[:, 0], idx[:, 1]
+        return self.coords[iy, ix], self.zones[iy, ix]
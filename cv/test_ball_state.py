@@ -0,0 +1,57 @@
+import numpy as np
+from bench_game_logic import synthetic_track
+from game_logic import NOMINAL_FPS, TABLE_H, TABLE_W, BallState, detect_event
+
+
+def rally_track(frames, seed=0):
+    """
+    Розыгрыш в координатах стола: у концов стола удар разворачивает мяч
+    и разгоняет его, в полёте мяч тормозит; плюс шум детекции.
+    """
+    rng = np.random.default_rng(seed)
+    points = []
+    x, y = 300.0, TABLE_H / 2
+    vx, vy = 60.0, 0.0
+    for _ in range(frames):
+        if (vx > 0 and x > TABLE_W - 300) or (vx < 0 and x < 300):
+            vx = -np.sign(vx) * rng.uniform(55, 70)
+            vy = (TABLE_H / 2 - y) / 60 + rng.uniform(-3, 3)
+        vx *= 0.985
+        x += vx
+        y += vy
+        points.append((x + rng.normal(0, 2), y + rng.normal(0, 2)))
+    return points
+
+
+def replay(points, every=1, offset=0.0):
+    """События [(event, номер кадра)] для каждого every-го кадра с метками offset + i / fps."""
+    ball_state = BallState()
+    events = []
+    for i in range(0, len(points), every):
+        x, y = points[i]
+        ball_state.update(x, y, 1000.0 + offset + i / NOMINAL_FPS)
+        event = detect_event(ball_state, x, y)
+        if event:
+            events.append((event, i))
+    return events
+
+
+def test_events_do_not_depend_on_timestamp_offset():
+    points = synthetic_track(6000, 1)
+    aligned = replay(points)
+    for offset in (0.005, 0.015, 0.5 / NOMINAL_FPS):
+        assert replay(points, offset=offset) == aligned
+
+
+def test_events_roughly_match_at_lower_fps():
+    points = rally_track(6000, 1)
+    hits = [i for event, i in replay(points) if event == "HIT"]
+    assert len(hits) > 50
+
+    # (every, доля событий 30 fps, которую должен найти прореженный поток)
+    for every, min_ratio in ((2, 0.85), (3, 0.55)):
+        sub = [i for event, i in replay(points, every=every, offset=0.01) if event == "HIT"]
+        assert min_ratio * len(hits) <= len(sub) <= len(hits) * 1.1
+        # Те же удары, с точностью до пары кадров прореженного потока
+        matched = sum(any(abs(i - j) <= 2 * every for j in hits) for i in sub)
+        assert matched >= 0.9 * len(sub)
@@ -0,0 +1,93 @@
+import numpy as np
+
+MODE_WINDOW = "window"
+MODE_ROI = "roi"
+MODE_FULL = "full"
+
+
+class SearchWindowTracker:
+    """
+    Предсказывает положение мяча в кадре (постоянная скорость) и выбирает,
+    где запускать детектор: маленькое окно вокруг предсказания, пока мяч
+    находится, и ROI стола / полный кадр после max_misses промахов подряд.
+
+    counters — сколько кадров прошло через каждый путь детекции.
+    """
+
+    def __init__(self, window=320, max_misses=3, fallback_roi=None):
+        self.window = window
+        self.max_misses = max_misses
+        self.fallback_roi = fallback_roi
+
+        self.last = None  # последний центр мяча в координатах кадра
+        self.velocity = np.zeros(2, dtype=np.float32)  # пикселей за кадр
+        self.age = 0  # кадров с последнего обнаружения
+        self.misses = 0
+
+        self.counters = {MODE_WINDOW: 0, MODE_ROI: 0, MODE_FULL: 0}
+
+    @property
+    def tracking(self):
+        return self.last is not None and self.misses < self.max_misses
+
+    def predict(self, ahead=1):
+        return self.last + self.velocity * (self.age + ahead)
+
+    def plan(self, n, frame_shape, steps=None):
+        """
+        Области детекции для следующих n кадров (None — полный кадр).
+        steps — на сколько кадров вперёд каждый из них (по умолчанию 1..n),
+        если часть кадров между ними обрабатывается без детекции.
+        """
+        h, w = frame_shape[:2]
+        half = self.window // 2
+        steps = range(1, n + 1) if steps is None else steps
+        rois = []
+
+        for step in steps:
+            if self.tracking:
+                cx, cy = self.predict(step)
+                # Окно целиком внутри кадра, даже если предсказание у края
+                x1 = int(min(max(cx - half, 0), max(w - self.window, 0)))
+                y1 = int(min(max(cy - half, 0), max(h - self.window, 0)))
+                rois.append((x1, y1, x1 + self.window, y1 + self.window))
+                mode = MODE_WINDOW
+            elif self.fallback_roi is not None:
+                rois.append(self.fallback_roi)
+                mode = MODE_ROI
+            else:
+                rois.append(None)
+                mode = MODE_FULL
+
+            self.counters[mode] += 1
+
+        return rois
+
+    def advance(self):
+        """Кадр прошёл без детекции — промахом не считается."""
+        self.age += 1
+
+    def observe(self, detections: np.ndarray):
+        """
+        Обновляет трекер детекциями очередного кадра ([x1, y1, x2, y2, conf, cls]).
+        Вызывать по одному разу на кадр, в порядке кадров.
+        """
+        balls = detections[detections[:, 5] == 0]
+        if len(balls) == 0:
+            self.misses += 1
+            self.age += 1
+            return None
+
+        best = balls[np.argmax(balls[:, 4])]
+        center = np.array([(best[0] + best[2]) / 2, (best[1] + best[3]) / 2], dtype=np.float32)
+
+        if self.last is not None and self.misses < self.max_misses:
+            self.velocity = (center - self.last) / (self.age + 1)
+        else:
+            # Мяч найден заново после потери — старая скорость не актуальна
+            self.velocity[:] = 0
+
+        self.last = center
+        self.age = 0
+        self.misses = 0
+        return center
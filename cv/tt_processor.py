@@ -1,9 +1,15 @@
 import json
+import time
+from functools import lru_cache
 
 import cv2
 import numpy as np
 from game_logic import *
-from ultralytics.models import YOLO
+from lean_detector import LeanDetector
+from motion_gate import MotionGate
+from table_lut import TableLUT, lut_path, map_to_table, zones_of
+from tracking import SearchWindowTracker
+from yuv import PIX_FMT_BGR, Painter, image_shape, to_bgr
 
 TABLE_W = 2740
 TABLE_H = 1525
@@ -19,6 +25,9 @@ TRAJECTORY_THICKNESS = 3
 MAX_TRAJECTORY_POINTS = 20
 MAX_TOP_VIEW_POINTS = 50
 
+# Состояния RallyFSM, в которых мяч не в игре (для MotionGate)
+BETWEEN_RALLIES = (RallyState.IDLE, RallyState.FINISHED)
+
 
 def load_table_corners(json_path: str) -> np.ndarray:
     with open(json_path, "r", encoding="utf-8") as f:
@@ -40,6 +49,24 @@ def compute_homography_matrix(src_points: np.ndarray):
     return H, dst_points
 
 
+def compute_table_roi(src_corners: np.ndarray, margin=0.15, margin_top=0.6):
+    """
+    Область кадра вокруг стола для детекции: (x1, y1, x2, y2).
+    Отступы — доли ширины стола в кадре; сверху отдельный, бо́льший отступ,
+    чтобы не терять мяч в полёте над столом. Обрезка по краям кадра — в Detector.
+    """
+    x_min, y_min = src_corners.min(axis=0)
+    x_max, y_max = src_corners.max(axis=0)
+    pad = (x_max - x_min) * margin
+    pad_top = (x_max - x_min) * margin_top
+    return (
+        int(x_min - pad),
+        int(y_min - pad_top),
+        int(np.ceil(x_max + pad)),
+        int(np.ceil(y_max + pad)),
+    )
+
+
 def get_zone(x, y):
     if x < MID_X and y < MID_Y:
         return 3
@@ -51,19 +78,411 @@ def get_zone(x, y):
         return 2
 
 
+class Detector:
+    """
+    Обёртка над YOLO: батч кадров -> по массиву [x1, y1, x2, y2, conf, cls] на кадр.
+    model_path может указывать на .pt, .onnx или каталог *_openvino_model
+    (см. backends.resolve_model_path).
+    """
+
+    def __init__(self, model_path, conf=0.2, iou=0.7):
+        # ultralytics тянет torch — импортируем только там, где модель реально нужна
+        from ultralytics.models import YOLO
+
+        self.model = YOLO(model_path, task="detect")
+        self.conf = conf
+        self.iou = iou
+
+    def detect(self, frames, roi=None):
+        """
+        roi=(x1, y1, x2, y2) — детекция только внутри области, боксы
+        возвращаются в координатах полного кадра. Можно передать список
+        областей — по одной на кадр (None — полный кадр).
+        """
+        frames = list(frames)
+        rois = roi if isinstance(roi, list) else [roi] * len(frames)
+
+        offsets = []
+        for i, (frame, r) in enumerate(zip(frames, rois)):
+            if r is None:
+                offsets.append(None)
+                continue
+            h, w = frame.shape[:2]
+            x1, y1 = max(0, r[0]), max(0, r[1])
+            x2, y2 = min(w, r[2]), min(h, r[3])
+            frames[i] = frame[y1:y2, x1:x2]
+            offsets.append(np.array([x1, y1, x1, y1], dtype=np.float32))
+
+        results = self.model(source=frames, conf=self.conf, iou=self.iou, verbose=False)
+
+        detections = []
+        for r, offset in zip(results, offsets):
+            if r.boxes is None:
+                detections.append(np.empty((0, 6), dtype=np.float32))
+                continue
+            dets = r.boxes.data[:, :6].cpu().numpy().astype(np.float32)
+            if offset is not None:
+                dets[:, :4] += offset
+            detections.append(dets)
+        return detections
+
+
+def make_detector(model_path, conf=0.2, iou=0.7, lean=False, threads=0):
+    """Detector или LeanDetector (lean=True) с одинаковым контрактом detect()."""
+    if lean:
+        return LeanDetector(model_path, conf, iou, threads=threads)
+    return Detector(model_path, conf, iou)
+
+
+def detect_frames(detector, frames, roi=None, pix_fmt=PIX_FMT_BGR, scale=None):
+    """
+    Detector.detect для кадров в любом формате FramePool. Кадры YUV 4:2:0
+    переводятся в BGR только в пределах roi (своей для каждого кадра,
+    если передан список), боксы возвращаются в координатах полного кадра.
+
+    scale=(sx, sy) — frames уменьшенные BGR-кадры для детектора
+    (FramePool.view_infer), во столько раз меньше полного: roi задаётся
+    и боксы возвращаются в координатах полного кадра.
+    """
+    if scale is not None:
+        return _detect_scaled(detector, frames, roi, scale)
+    if pix_fmt == PIX_FMT_BGR:
+        return detector.detect(frames, roi=roi)
+
+    frames = list(frames)
+    rois = roi if isinstance(roi, list) else [roi] * len(frames)
+    crops, offsets = [], []
+    for frame, r in zip(frames, rois):
+        crop, (x1, y1) = to_bgr(frame, pix_fmt, r)
+        crops.append(crop)
+        offsets.append(np.array([x1, y1, x1, y1], dtype=np.float32))
+
+    detections = detector.detect(crops)
+    for dets, offset in zip(detections, offsets):
+        dets[:, :4] += offset
+    return detections
+
+
+def _detect_scaled(detector, frames, roi, scale):
+    sx, sy = scale
+    rois = roi if isinstance(roi, list) else [roi] * len(frames)
+    # Область в уменьшенном кадре — с округлением наружу
+    rois = [
+        None
+        if r is None
+        else (int(r[0] / sx), int(r[1] / sy), int(np.ceil(r[2] / sx)), int(np.ceil(r[3] / sy)))
+        for r in rois
+    ]
+    factor = np.array([sx, sy, sx, sy], dtype=np.float32)
+    detections = detector.detect(frames, roi=rois)
+    for dets in detections:
+        dets[:, :4] *= factor
+    return detections
+
+
+def ball_centers(detections):
+    """Центры боксов мяча (класс 0) в пикселях, (N, 2) int — как в update()."""
+    balls = detections[detections[:, 5].astype(int) == 0, :4].astype(int)
+    return np.stack([(balls[:, 0] + balls[:, 2]) // 2, (balls[:, 1] + balls[:, 3]) // 2], axis=1)
+
+
+class TrajectoryBuffer:
+    """
+    Последние capacity точек траектории (int32) в кольцевом буфере NumPy.
+    Каждая точка пишется дважды (i и i + capacity), поэтому последние точки
+    всегда лежат подряд и points() — срез без копирования.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self._buf = np.zeros((2 * capacity, 2), dtype=np.int32)
+        self._head = 0  # куда писать следующую точку
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    def append(self, x, y):
+        self._buf[self._head] = self._buf[self._head + self.capacity] = (x, y)
+        self._head = (self._head + 1) % self.capacity
+        self._count = min(self._count + 1, self.capacity)
+
+    def points(self):
+        """(N, 2) — представление буфера, меняется следующим append()."""
+        end = self._head + self.capacity
+        return self._buf[end - self._count : end]
+
+
+def _draw_table(painter, src_corners):
+    for i, corner in enumerate(src_corners):
+        painter.circle(tuple(corner.astype(int)), 8, (0, 255, 255), -1)
+        painter.put_text(
+            str(i + 1), (int(corner[0]) + 10, int(corner[1]) - 10), 0.8, (0, 255, 255), 2
+        )
+
+    pts = src_corners.reshape((-1, 1, 2)).astype(np.int32)
+    painter.polylines([pts], True, (0, 255, 255), 2)
+
+
+class TableLayer:
+    """
+    Разметка стола (углы, номера, контур) для кадров одной формы и формата,
+    отрисованная один раз: на кадр она переносится копированием только
+    закрашенных байт буфера, без повторной отрисовки.
+
+    Слой — две отрисовки на фоне 0 и 255: байт, одинаковый в обеих, закрашен
+    полностью, разница между ними — доля фона, оставшаяся на сглаженных
+    краях (текст в OpenCV 5). Так слой одинаково работает для bgr24
+    и плоскостей YUV.
+    """
+
+    def __init__(self, src_corners, shape, pix_fmt=PIX_FMT_BGR):
+        drawn = []
+        for background in (0, 255):
+            layer = np.full(shape, background, dtype=np.uint8)
+            _draw_table(Painter(layer, pix_fmt), src_corners)
+            drawn.append(layer.reshape(-1))
+        low, high = drawn
+        keep = high.astype(np.uint16) - low
+
+        self.index = np.flatnonzero(keep == 0)
+        self.values = low[self.index]
+        # Края: значение = low + keep / 255 * фон
+        self.blend_index = np.flatnonzero((keep > 0) & (keep < 255))
+        self.blend_low = low[self.blend_index].astype(np.uint16)
+        self.blend_keep = keep[self.blend_index]
+
+    def apply(self, frame):
+        if not frame.flags.c_contiguous:
+            np.put(frame, self.index, self.values)
+            under = np.take(frame, self.blend_index).astype(np.uint16)
+            blended = self.blend_low + (self.blend_keep * under + 127) // 255
+            np.put(frame, self.blend_index, blended.astype(np.uint8))
+            return
+
+        flat = frame.reshape(-1)
+        flat[self.index] = self.values
+        if len(self.blend_index):
+            under = flat[self.blend_index].astype(np.uint16)
+            flat[self.blend_index] = self.blend_low + (self.blend_keep * under + 127) // 255
+
+
+@lru_cache(maxsize=8)
+def _table_layer(corners, shape, pix_fmt):
+    return TableLayer(np.frombuffer(corners, dtype=np.float32).reshape(-1, 2), shape, pix_fmt)
+
+
+def draw_overlay(frame: np.ndarray, overlay, src_corners: np.ndarray, pix_fmt=PIX_FMT_BGR):
+    """
+    Рисует на кадре углы стола, боксы и траекторию мяча по данным из update().
+    Кадр в yuv420p/nv12 рисуется прямо в плоскостях YUV (см. yuv.Painter).
+    Разметка стола не меняется между кадрами — она берётся из TableLayer.
+    """
+    corners = np.ascontiguousarray(src_corners, dtype=np.float32).tobytes()
+    _table_layer(corners, frame.shape, pix_fmt).apply(frame)
+
+    painter = Painter(frame, pix_fmt)
+    pts_tr = np.asarray(overlay["trajectory"], np.int32)
+    if len(pts_tr) > 1:
+        painter.polylines([pts_tr], False, TRAJECTORY_COLOR, TRAJECTORY_THICKNESS)
+
+    for x1, y1, x2, y2, cls, conf in overlay["boxes"]:
+        if cls == 0:
+            color = BALL_COLOR
+            label = f"Ball {conf:.2f}"
+        else:
+            color = OTHER_COLOR
+            label = f"Class {cls} {conf:.2f}"
+
+        painter.rectangle((x1, y1), (x2, y2), color, 2)
+        painter.put_text(label, (x1, y1 - 8), 0.6, color, 2)
+
+    return frame
+
+
+def new_top_view(dst_points: np.ndarray, scale: float = 1.0):
+    """
+    Статичный фон вида сверху: средние линии и контур стола
+    """
+    w = round(TABLE_W * scale)
+    h = round(TABLE_H * scale)
+    mid_x = round(MID_X * scale)
+    mid_y = round(MID_Y * scale)
+
+    top_view = np.zeros((h, w, 3), dtype=np.uint8)
+    cv2.line(top_view, (mid_x, 0), (mid_x, h), (255, 255, 255), max(1, round(2 * scale)))
+    cv2.line(top_view, (0, mid_y), (w, mid_y), (255, 255, 255), max(1, round(2 * scale)))
+    table_outline = np.round(np.asarray(dst_points) * scale).astype(np.int32)
+    cv2.polylines(top_view, [table_outline], True, (0, 255, 255), max(1, round(3 * scale)))
+    return top_view
+
+
+def _text_rect(text, org, font_scale, thickness):
+    (tw, th), base = cv2.getTextSize(text, cv2.FONT_HERSHEY_SIMPLEX, font_scale, thickness)
+    x, y = org
+    return (x - thickness, y - th - thickness, x + tw + thickness + 1, y + base + thickness + 1)
+
+
+def draw_top_view(top_view: np.ndarray, overlay, scale: float = 1.0, rects=None):
+    """
+    Рисует мяч, траекторию, зоны и счёт на виде сверху (координаты стола * scale).
+    rects — список, куда добавляются (x1, y1, x2, y2) закрашенных областей.
+    """
+    thickness = max(1, round(3 * scale))
+    font_thickness = max(1, round(2 * scale))
+    radius = max(1, round(10 * scale))
+    touched = [] if rects is None else rects
+
+    pts_tv = np.round(np.asarray(overlay["top_trajectory"], np.float32) * scale).astype(np.int32)
+    if overlay["top_balls"] and len(pts_tv) > 1:
+        (x1, y1), (x2, y2) = pts_tv.min(axis=0), pts_tv.max(axis=0)
+        touched.append((x1 - thickness, y1 - thickness, x2 + thickness + 1, y2 + thickness + 1))
+
+    for mx, my, zone in overlay["top_balls"]:
+        mx, my = round(mx * scale), round(my * scale)
+        cv2.circle(top_view, (mx, my), radius, BALL_COLOR, -1)
+        touched.append((mx - radius - 1, my - radius - 1, mx + radius + 2, my + radius + 2))
+        if len(pts_tv) > 1:
+            cv2.polylines(top_view, [pts_tv], False, BALL_COLOR, thickness)
+
+        label, org = f"Z{zone}", (mx + round(15 * scale), my - round(15 * scale))
+        cv2.putText(
+            top_view, label, org, cv2.FONT_HERSHEY_SIMPLEX, 0.8 * scale, BALL_COLOR, font_thickness
+        )
+        touched.append(_text_rect(label, org, 0.8 * scale, font_thickness))
+
+    left, right = overlay["score"]
+    label, org = f"{left} : {right}", (round((TABLE_W // 2 - 60) * scale), round(50 * scale))
+    cv2.putText(
+        top_view, label, org, cv2.FONT_HERSHEY_SIMPLEX, 1.5 * scale, (255, 255, 255), thickness
+    )
+    touched.append(_text_rect(label, org, 1.5 * scale, thickness))
+    return top_view
+
+
+class TopViewRenderer:
+    """
+    Вид сверху с фоном, отрисованным один раз при создании.
+
+    Кадры рисуются в заранее выделенные буферы (по одному на позицию в батче),
+    поэтому результат render() действителен до следующего вызова с тем же slot.
+    Буфер не перезаливается фоном целиком: восстанавливаются только области,
+    закрашенные при прошлой отрисовке в этот slot.
+    """
+
+    def __init__(self, dst_points: np.ndarray, scale: float = 1.0):
+        self.scale = scale
+        self.background = new_top_view(dst_points, scale)
+        self._buffers = []
+        self._dirty = []
+
+    def _buffer(self, slot):
+        while len(self._buffers) <= slot:
+            self._buffers.append(self.background.copy())
+            self._dirty.append([])
+        buf = self._buffers[slot]
+        for x1, y1, x2, y2 in self._dirty[slot]:
+            x1, y1 = max(0, x1), max(0, y1)
+            buf[y1:y2, x1:x2] = self.background[y1:y2, x1:x2]
+        self._dirty[slot] = []
+        return buf
+
+    def blank(self, slot=0):
+        return self._buffer(slot)
+
+    def render(self, overlay, slot=0):
+        buf = self._buffer(slot)
+        return draw_top_view(buf, overlay, self.scale, self._dirty[slot])
+
+
 class TableTennisProcessor:
-    def __init__(self, model_path, corners_json, conf=0.2, iou=0.7):
-        self.model = YOLO(model_path)
+    def __init__(
+        self,
+        model_path,
+        corners_json,
+        conf=0.2,
+        iou=0.7,
+        top_view_scale=1.0,
+        roi=False,
+        roi_margin=0.15,
+        roi_margin_top=0.6,
+        track=False,
+        track_window=320,
+        track_max_misses=3,
+        table_lut=False,
+        table_lut_step=1,
+        frame_size=None,
+        pix_fmt=PIX_FMT_BGR,
+        detector=None,
+        motion_gate=False,
+        motion_threshold=15,
+        motion_idle_every=0,
+        lean=False,
+        infer_threads=0,
+    ):
+        # model_path=None — процессор без модели: детекции приходят снаружи
+        # (например, из отдельного процесса инференса) через update().
+        # detector — готовый детектор вместо загрузки своей модели
+        # (например, shared_inference.DetectorClient общей модели нескольких потоков).
+        # lean=True — модель без предиктора ultralytics (см. LeanDetector)
+        if detector is None and model_path:
+            detector = make_detector(model_path, conf, iou, lean, infer_threads)
+        self.detector = detector
         self.conf = conf
         self.iou = iou
+        # Формат кадров (yuv.PIX_FMTS): в BGR переводится только область детекции,
+        # оверлей рисуется прямо в YUV
+        self.pix_fmt = pix_fmt
 
         self.src_corners = load_table_corners(corners_json)
         self.H, self.dst_points = compute_homography_matrix(self.src_corners)
         if self.H is None:
             raise RuntimeError("Homography matrix could not be computed")
 
+        # table_lut=True — пиксели в координаты стола через предрасчитанную
+        # таблицу рядом с corners_json (см. TableLUT). Без frame_size таблица
+        # строится по первому кадру в process_batch.
+        self.table_lut = None
+        self._table_lut_path = lut_path(corners_json) if table_lut else None
+        self._table_lut_step = table_lut_step
+        if table_lut and frame_size is not None:
+            self._load_table_lut(frame_size)
+
+        # roi=True — детекция только в области вокруг стола
+        self.roi = compute_table_roi(self.src_corners, roi_margin, roi_margin_top) if roi else None
+
+        # Трекер всегда ведёт модель движения мяча (нужна для интерполяции
+        # кадров без инференса). track=True — пока мяч ведётся, детекция только
+        # в окне вокруг предсказания; объекты вне окна в такие кадры не попадают
+        self.track = track
+        self.tracker = SearchWindowTracker(track_window, track_max_misses, self.roi)
+
+        # motion_gate=True — между розыгрышами модель запускается только на
+        # кадрах с движением над столом (область — как у roi), в покое —
+        # на каждом motion_idle_every-м кадре (0 — не запускается)
+        self.motion_gate = None
+        if motion_gate:
+            self.motion_gate = MotionGate(
+                compute_table_roi(self.src_corners, roi_margin, roi_margin_top),
+                threshold=motion_threshold,
+                idle_every=motion_idle_every,
+            )
+
+        self.top_view = TopViewRenderer(self.dst_points, top_view_scale)
+
         self.trajectories = {}
         self.top_view_trajectories = {}
+        # Данные для отрисовки кадров последнего батча (см. update())
+        self.last_overlays = []
+        self._last_overlay = None
+
+        # on_timing(stage, seconds_per_frame, frames) — замеры стадий
+        # inference / logic / draw (для бенчмарка и метрик)
+        self.on_timing = None
+        # on_event(event, side, winner) — игровое событие (HIT/BOUNCE/NET/OUT);
+        # winner — сторона, выигравшая очко, или None. Счёт current_game
+        # в момент вызова уже учитывает это очко.
+        self.on_event = None
 
         # Game logic
         self.ball_state = BallState()
@@ -71,118 +490,247 @@ class TableTennisProcessor:
         self.match = Match(best_of=5)
         self.rally = RallyFSM()
 
-    def process_frame(self, frame: np.ndarray):
-        # ------------------------------
-        # Рабочая копия кадра для OpenCV
-        # ------------------------------
-        frame = frame.copy()
+    def _load_table_lut(self, frame_size):
+        self.table_lut = TableLUT.load_or_build(
+            self._table_lut_path, self.H, frame_size, self._table_lut_step
+        )
 
-        top_view = np.zeros((TABLE_H, TABLE_W, 3), dtype=np.uint8)
-        cv2.line(top_view, (MID_X, 0), (MID_X, TABLE_H), (255, 255, 255), 2)
-        cv2.line(top_view, (0, MID_Y), (TABLE_W, MID_Y), (255, 255, 255), 2)
-        table_outline = np.array(self.dst_points, dtype=np.int32)
-        cv2.polylines(top_view, [table_outline], True, (0, 255, 255), 3)
+    def to_table(self, points):
+        """
+        Пиксели кадра (N, 2) -> (координаты стола (N, 2) int, зоны (N,))
+        одним векторным вызовом: через TableLUT или гомографию.
+        """
+        if self.table_lut is not None:
+            coords, zones = self.table_lut.lookup(points)
+        else:
+            coords = map_to_table(points, self.H)
+            zones = zones_of(coords)
+        return coords.astype(int), zones
+
+    def process_frame(
+        self, frame: np.ndarray, copy: bool = True, top_view: bool = True, timestamp=None
+    ):
+        timestamps = None if timestamp is None else [timestamp]
+        return self.process_batch([frame], copy=copy, top_view=top_view, timestamps=timestamps)[0]
+
+    def process_batch(
+        self,
+        frames,
+        copy: bool = True,
+        top_view=True,
+        infer=True,
+        overlays=True,
+        timestamps=None,
+        infer_frames=None,
+    ):
+        """
+        Детекция на нескольких кадрах одним вызовом модели, затем
+        покадровое обновление игровой логики строго в порядке кадров.
+
+        top_view — рисовать ли вид сверху: bool для всего батча или список
+        bool по кадрам. Для неотрисованных кадров вместо top_view будет None,
+        векторные данные (мяч, зоны, счёт) всё равно доступны в last_overlays.
+
+        infer — запускать ли модель (bool или список по кадрам). Кадры без
+        инференса получают предыдущие боксы с мячом, сдвинутым по предсказанию
+        трекера; игровая логика на них не обновляется. С motion_gate
+        маска дополнительно урезается в паузах между розыгрышами.
+        overlays=False — не рисовать на кадрах ничего (только игровая логика).
+        timestamps — время захвата кадров в секундах; без него игровая логика
+        считает, что кадры идут с частотой NOMINAL_FPS.
+        infer_frames — уменьшенные BGR-копии кадров для детектора (например,
+        FramePool.view_infer); боксы пересчитываются в координаты frames.
+
+        Возвращает список пар (frame, top_view); top_view переиспользуется
+        между вызовами — скопируйте его, если нужно хранить дольше.
+        """
+        if isinstance(top_view, bool):
+            top_view = [top_view] * len(frames)
+        if isinstance(infer, bool):
+            infer = [infer] * len(frames)
+        if timestamps is None:
+            timestamps = [None] * len(frames)
+
+        if self.motion_gate is not None:
+            t0 = time.perf_counter()
+            # Между розыгрышами: подачи ещё не было или очко уже разыграно
+            # (FINISHED держится до следующего сброса RallyFSM)
+            idle = self.rally.state in BETWEEN_RALLIES and not self.tracker.tracking
+            infer = self.motion_gate.plan(frames, infer, idle, self.pix_fmt)
+            self._timing("motion", time.perf_counter() - t0, len(frames))
 
         # ------------------------------
-        # YOLO detection
+        # Рабочие копии кадров для OpenCV
+        # (copy=False — рисуем прямо в переданных буферах, например в слотах FramePool)
         # ------------------------------
-        try:
-            results = self.model(source=frame, conf=self.conf, iou=self.iou, verbose=False)[0]
-        except Exception:
-            # Если YOLO упала, просто возвращаем frame без обработки
-            return frame, top_view
+        if copy:
+            frames = [frame.copy() for frame in frames]
+        else:
+            frames = list(frames)
 
         # ------------------------------
-        # Draw table corners
+        # YOLO detection (батч)
         # ------------------------------
-        for i, corner in enumerate(self.src_corners):
-            cv2.circle(frame, tuple(corner.astype(int)), 8, (0, 255, 255), -1)
-            cv2.putText(
-                frame,
-                str(i + 1),
-                (int(corner[0]) + 10, int(corner[1]) - 10),
-                cv2.FONT_HERSHEY_SIMPLEX,
-                0.8,
-                (0, 255, 255),
-                2,
-            )
+        infer_idx = [i for i, flag in enumerate(infer) if flag]
 
-        pts = self.src_corners.reshape((-1, 1, 2)).astype(np.int32)
-        cv2.polylines(frame, [pts], True, (0, 255, 255), 2)
+        rois = self.roi
+        if self.track:
+            steps = [i + 1 for i in infer_idx]
+            rois = self.tracker.plan(len(infer_idx), image_shape(frames[0], self.pix_fmt), steps)
 
-        if results.boxes is None:
-            return frame, top_view
-
-        boxes = results.boxes.xyxy.cpu().numpy()
-        classes = results.boxes.cls.cpu().numpy().astype(int)
-        confidences = results.boxes.conf.cpu().numpy()
+        try:
+            detections = []
+            if infer_idx:
+                t0 = time.perf_counter()
+                if infer_frames is None:
+                    detections = detect_frames(
+                        self.detector, [frames[i] for i in infer_idx], rois, self.pix_fmt
+                    )
+                else:
+                    h, w = image_shape(frames[0], self.pix_fmt)
+                    ih, iw = infer_frames[0].shape[:2]
+                    detections = detect_frames(
+                        self.detector,
+                        [infer_frames[i] for i in infer_idx],
+                        rois,
+                        scale=(w / iw, h / ih),
+                    )
+                self._timing("inference", time.perf_counter() - t0, len(infer_idx))
+        except Exception:
+            # Если YOLO упала, просто возвращаем кадры без обработки
+            self.last_overlays = []
+            return [
+                (frame, self.top_view.blank(i) if top_view[i] else None)
+                for i, frame in enumerate(frames)
+            ]
+        detections = dict(zip(infer_idx, detections))
+
+        # Все мячи батча — в координаты стола одним вызовом
+        if self._table_lut_path is not None and self.table_lut is None:
+            h, w = image_shape(frames[0], self.pix_fmt)
+            self._load_table_lut((w, h))
+        centers = [ball_centers(detections[i]) for i in infer_idx]
+        coords, zones = self.to_table(np.concatenate(centers) if centers else [])
+        splits = np.cumsum([len(c) for c in centers])[:-1]
+        table = dict(zip(infer_idx, zip(np.split(coords, splits), np.split(zones, splits))))
+
+        out = []
+        self.last_overlays = []
+        for i, frame in enumerate(frames):
+            t0 = time.perf_counter()
+            if i in detections:
+                self.tracker.observe(detections[i])
+                overlay = self.update(detections[i], timestamps[i], table[i])
+            else:
+                self.tracker.advance()
+                overlay = self._interpolate_overlay()
+            self.last_overlays.append(overlay)
+            t1 = time.perf_counter()
+
+            if overlays:
+                draw_overlay(frame, overlay, self.src_corners, self.pix_fmt)
+            out.append((frame, self.top_view.render(overlay, i) if top_view[i] else None))
+
+            self._timing("logic", t1 - t0)
+            self._timing("draw", time.perf_counter() - t1)
+        return out
+
+    def _timing(self, stage, seconds, frames=1):
+        if self.on_timing is not None:
+            self.on_timing(stage, seconds / frames, frames)
+
+    def _interpolate_overlay(self):
+        """
+        Данные для кадра без инференса: последние боксы, мяч сдвинут
+        в положение, предсказанное трекером.
+        """
+        last = self._last_overlay
+        if last is None:
+            overlay = self._empty_overlay()
+            overlay["score"] = (self.current_game.score[LEFT], self.current_game.score[RIGHT])
+            return overlay
+
+        overlay = dict(last)
+        if self.tracker.tracking:
+            dx, dy = (int(v) for v in self.tracker.predict(0) - self.tracker.last)
+            overlay["boxes"] = []
+            for x1, y1, x2, y2, cls, conf in last["boxes"]:
+                if cls == 0:
+                    x1, y1, x2, y2 = x1 + dx, y1 + dy, x2 + dx, y2 + dy
+                overlay["boxes"].append((x1, y1, x2, y2, cls, conf))
+        return overlay
+
+    @staticmethod
+    def _trajectory(trajectories, track_id, capacity):
+        trajectory = trajectories.get(track_id)
+        if trajectory is None:
+            trajectory = trajectories[track_id] = TrajectoryBuffer(capacity)
+        return trajectory
+
+    def _empty_overlay(self):
+        return {
+            "boxes": [],
+            "trajectory": [],
+            "top_balls": [],
+            "top_trajectory": [],
+        }
+
+    def update(self, detections: np.ndarray, ts=None, table=None):
+        """
+        Игровая логика по детекциям одного кадра ([x1, y1, x2, y2, conf, cls]).
+        Должна вызываться строго в порядке кадров; ts — время захвата кадра
+        в секундах (см. BallState.update). table — уже посчитанные
+        to_table(ball_centers(detections)). Возвращает данные для отрисовки.
+        """
+        overlay = self._empty_overlay()
+        if table is None:
+            table = self.to_table(ball_centers(detections))
+        coords, zones = table
+        ball = 0
+
+        for x1, y1, x2, y2, conf, cls in detections:
+            x1, y1, x2, y2 = int(x1), int(y1), int(x2), int(y2)
+            cls = int(cls)
+            conf = float(conf)
+            overlay["boxes"].append((x1, y1, x2, y2, cls, conf))
+
+            if cls != 0:
+                continue
 
-        for box, cls, conf in zip(boxes, classes, confidences):
-            x1, y1, x2, y2 = map(int, box)
             cx = (x1 + x2) // 2
             cy = (y1 + y2) // 2
+            track_id = 0
+
+            trajectory = self._trajectory(self.trajectories, track_id, MAX_TRAJECTORY_POINTS)
+            trajectory.append(cx, cy)
+            overlay["trajectory"] = trajectory.points().copy()
+
+            mx, my = (int(v) for v in coords[ball])
+            zone = int(zones[ball])
+            ball += 1
+
+            self.ball_state.update(mx, my, ts)
+            event = detect_event(self.ball_state, mx, my)
+            side = side_of_table(mx)
+            loser = self.rally.step(event, side)
+            winner = None
+            if loser:
+                winner = LEFT if loser == RIGHT else RIGHT
+                self.current_game.add_point(winner)
+            if event is not None and self.on_event is not None:
+                self.on_event(event, side, winner)
+            if winner and self.current_game.finished:
+                self.match.games_won[winner] += 1
+                self.rally.reset()
+                self.current_game = Game()
+
+            top_trajectory = self._trajectory(
+                self.top_view_trajectories, track_id, MAX_TOP_VIEW_POINTS
+            )
+            top_trajectory.append(mx, my)
+            overlay["top_balls"].append((mx, my, zone))
+            overlay["top_trajectory"] = top_trajectory.points().copy()
 
-            if cls == 0:
-                color = BALL_COLOR
-                label = f"Ball {conf:.2f}"
-                track_id = 0
-
-                self.trajectories.setdefault(track_id, []).append((cx, cy))
-                # Храним только последние MAX_TRAJECTORY_POINTS
-                self.trajectories[track_id] = self.trajectories[track_id][-MAX_TRAJECTORY_POINTS:]
-
-                pts_tr = np.array(self.trajectories[track_id], np.int32)
-                if len(pts_tr) > 1:
-                    cv2.polylines(frame, [pts_tr], False, TRAJECTORY_COLOR, TRAJECTORY_THICKNESS)
-
-                pt = np.array([[[cx, cy]]], dtype=np.float32)
-                mx, my = cv2.perspectiveTransform(pt, self.H)[0][0].astype(int)
-
-                self.ball_state.update(mx, my)
-                event = detect_event(self.ball_state, mx, my)
-                side = side_of_table(mx)
-                loser = self.rally.step(event, side)
-                if loser:
-                    winner = LEFT if loser == RIGHT else RIGHT
-                    self.current_game.add_point(winner)
-                    if self.current_game.finished:
-                        self.match.games_won[winner] += 1
-                        self.rally.reset()
-                        self.current_game = Game()
-
-                self.top_view_trajectories.setdefault(track_id, []).append((mx, my))
-                self.top_view_trajectories[track_id] = self.top_view_trajectories[track_id][
-                    -MAX_TOP_VIEW_POINTS:
-                ]
-                cv2.circle(top_view, (mx, my), 10, BALL_COLOR, -1)
-                pts_tv = np.array(self.top_view_trajectories[track_id], np.int32)
-                if len(pts_tv) > 1:
-                    cv2.polylines(top_view, [pts_tv], False, BALL_COLOR, 3)
-                zone = get_zone(mx, my)
-                cv2.putText(
-                    top_view,
-                    f"Z{zone}",
-                    (mx + 15, my - 15),
-                    cv2.FONT_HERSHEY_SIMPLEX,
-                    0.8,
-                    BALL_COLOR,
-                    2,
-                )
-            else:
-                color = OTHER_COLOR
-                label = f"Class {cls} {conf:.2f}"
-
-            cv2.rectangle(frame, (x1, y1), (x2, y2), color, 2)
-            cv2.putText(frame, label, (x1, y1 - 8), cv2.FONT_HERSHEY_SIMPLEX, 0.6, color, 2)
-
-        cv2.putText(
-            top_view,
-            f"{self.current_game.score[LEFT]} : {self.current_game.score[RIGHT]}",
-            (TABLE_W // 2 - 60, 50),
-            cv2.FONT_HERSHEY_SIMPLEX,
-            1.5,
-            (255, 255, 255),
-            3,
-        )
-
-        return frame, top_view
+        overlay["score"] = (self.current_game.score[LEFT], self.current_game.score[RIGHT])
+        self._last_overlay = overlay
+        return overlay
@@ -2,21 +2,104 @@ import logging
 import queue
 import subprocess
 import threading
+import time
+
+import numpy as np
+from yuv import PIX_FMT_BGR
 
 log = logging.getLogger("writer")
 
 
 class RTSPWriter(threading.Thread):
-    def __init__(self, input_queue, output_url, width, height, fps):
+    """
+    Пишет кадры в ffmpeg по собственным часам вывода с частотой fps.
+
+    Каждый кадр несёт время представления (pts): время захвата слота FramePool
+    или, без пула, время получения из очереди. Кадр с pts попадает в такт
+    round((pts - base) * fps) выходной шкалы. Повтор предыдущего кадра
+    вставляется, только чтобы удержать fps: если к такту кадр не пришёл
+    за max_delay или во входном потоке пропуск.
+
+    - late — кадры, пришедшие после того, как их такт уже закрыт повтором;
+      пишутся в следующий такт, шкала сдвигается под новую задержку
+    - skipped — лишние кадры в уже занятый такт (источник быстрее fps)
+    """
+
+    def __init__(
+        self,
+        input_queue,
+        output_url,
+        width,
+        height,
+        fps,
+        pool=None,
+        pix_fmt=PIX_FMT_BGR,
+        max_delay=None,
+    ):
         super().__init__()
         self.input_queue = input_queue
+        # Если задан пул, из очереди приходят индексы слотов
+        self.pool = pool
         self.output_url = output_url
         self.width = width
         self.height = height
         self.fps = fps
+        # Формат входных кадров; yuv420p уходит в libx264 без конвертации
+        self.pix_fmt = pix_fmt
+        # Сколько ждать кадр сверх его такта, прежде чем вставить повтор
+        # (батч инференса отдаёт кадры пачками — задержка должна его покрывать)
+        self.max_delay = 2 / fps if max_delay is None else max_delay
         self.proc = None
         self.daemon = True
 
+        self.written = 0
+        self.duplicated = 0
+        self.late = 0
+        self.skipped = 0
+        # on_write(seconds) — длительность записи кадра в ffmpeg
+        self.on_write = None
+
+        # Часы вывода: такт emitted начинается в wall + emitted / fps,
+        # кадр с pts идёт в такт round((pts - base) * fps)
+        self.emitted = 0
+        self._base = None
+        self._wall = None
+
+    def _pts(self, item):
+        if self.pool is not None:
+            return self.pool.timestamp(item)
+        return time.monotonic()
+
+    def _deadline(self):
+        return self._wall + self.emitted / self.fps + self.max_delay
+
+    def _anchor(self, pts):
+        # Текущий кадр — такт emitted прямо сейчас
+        self._base = pts - self.emitted / self.fps
+        self._wall = time.monotonic() - self.emitted / self.fps
+
+    def _write(self, item):
+        if self.pool is not None:
+            data = self.pool.view(item).data
+        else:
+            data = np.ascontiguousarray(item).data
+
+        t0 = time.perf_counter()
+        try:
+            self.proc.stdin.write(data)
+        except BrokenPipeError:
+            log.error("Broken pipe — FFmpeg writer stopped")
+            return False
+        self.written += 1
+        self.emitted += 1
+        if self.on_write is not None:
+            self.on_write(time.perf_counter() - t0)
+        return True
+
+    def _release(self, item):
+        if self.pool is not None and item is not None:
+            self.pool.release(item)
+
     def run(self):
         cmd = [
             "ffmpeg",
@@ -24,7 +107,7 @@ class RTSPWriter(threading.Thread):
             "-f",
             "rawvideo",
             "-pix_fmt",
-            "bgr24",
+            self.pix_fmt,
             "-s",
             f"{self.width}x{self.height}",
             "-r",
@@ -46,25 +129,107 @@ class RTSPWriter(threading.Thread):
             self.output_url,
         ]
         self.proc = subprocess.Popen(cmd, stdin=subprocess.PIPE)
-        last_frame = None
+        last = None  # последний записанный кадр — для повторов
+        last_duplicated = False
 
         while True:
+            timeout = None
+            if last is not None:
+                timeout = max(0.0, self._deadline() - time.monotonic())
             try:
-                frame = self.input_queue.get(timeout=0.03)
-                if frame is None:
-                    break
-                last_frame = frame
+                item = self.input_queue.get(timeout=timeout)
             except queue.Empty:
-                if last_frame is None:
+                # Такт прошёл без нового кадра — держим fps повтором
+                if not self._write(last):
+                    break
+                self.duplicated += 1
+                last_duplicated = True
+                continue
+            if item is None:
+                break
+
+            pts = self._pts(item)
+            if self._base is None:
+                self._anchor(pts)
+            slot = round((pts - self._base) * self.fps)
+            if slot - self.emitted > self.fps:
+                # Разрыв больше секунды (переподключение источника) — не заполняем
+                self._anchor(pts)
+                slot = self.emitted
+
+            if slot < self.emitted:
+                if not last_duplicated:
+                    self.skipped += 1
+                    self._release(item)
                     continue
-                frame = last_frame
+                # Такт кадра уже закрыт повтором: пишем в текущий и сдвигаем шкалу
+                self.late += 1
+                self._anchor(pts)
 
-            try:
-                self.proc.stdin.write(frame.tobytes())
-            except BrokenPipeError:
-                log.error("Broken pipe — FFmpeg writer stopped")
+            # Пропуск во входном потоке — заполняем такты повторами
+            ok = True
+            while ok and last is not None and slot > self.emitted:
+                ok = self._write(last)
+                self.duplicated += 1
+            if not ok or not self._write(item):
+                self._release(item)
                 break
 
+            # Предыдущий кадр больше не нужен для повтора — возвращаем в пул
+            self._release(last)
+            last = item
+            last_duplicated = False
+
+        self._release(last)
+
         if self.proc:
             self.proc.stdin.close()
             self.proc.wait()
+
+
+class RTSPRelay(threading.Thread):
+    """
+    Пересылает входной RTSP на выход как есть (-c copy), без декодирования
+    и кодирования. ffmpeg перезапускается, если поток оборвался.
+    """
+
+    def __init__(self, input_url, output_url, restart_delay=2.0):
+        super().__init__()
+        self.input_url = input_url
+        self.output_url = output_url
+        self.restart_delay = restart_delay
+        self.proc = None
+        self.daemon = True
+        self.restarts = 0
+        self._stopped = threading.Event()
+
+    def run(self):
+        cmd = [
+            "ffmpeg",
+            "-rtsp_transport",
+            "tcp",
+            "-i",
+            self.input_url,
+            "-map",
+            "0:v",
+            "-c",
+            "copy",
+            "-f",
+            "rtsp",
+            "-rtsp_transport",
+            "tcp",
+            self.output_url,
+        ]
+        while not self._stopped.is_set():
+            self.proc = subprocess.Popen(cmd, stdin=subprocess.DEVNULL)
+            code = self.proc.wait()
+            if self._stopped.is_set():
+                break
+            self.restarts += 1
+            log.warning(f"FFmpeg relay exited with {code}, restarting")
+            self._stopped.wait(self.restart_delay)
+
+    def stop(self):
+        self._stopped.set()
+        if self.proc is not None and self.proc.poll() is None:
+            self.proc.terminate()
@@ -0,0 +1,194 @@
+from functools import lru_cache
+
+import cv2
+import numpy as np
+
+PIX_FMT_BGR = "bgr24"
+PIX_FMT_I420 = "yuv420p"
+PIX_FMT_NV12 = "nv12"
+
+PIX_FMTS = (PIX_FMT_BGR, PIX_FMT_I420, PIX_FMT_NV12)
+
+_TO_BGR = {PIX_FMT_I420: cv2.COLOR_YUV2BGR_I420, PIX_FMT_NV12: cv2.COLOR_YUV2BGR_NV12}
+
+
+def check_pix_fmt(pix_fmt, width=None, height=None):
+    if pix_fmt not in PIX_FMTS:
+        raise ValueError(f"Unknown pixel format: {pix_fmt}, expected one of {PIX_FMTS}")
+    if pix_fmt != PIX_FMT_BGR and width is not None and (width % 2 or height % 2):
+        raise ValueError(f"{pix_fmt} needs even frame size, got {width}x{height}")
+
+
+def frame_shape(width, height, pix_fmt=PIX_FMT_BGR):
+    """
+    Форма буфера кадра в том виде, в каком его отдаёт/принимает ffmpeg rawvideo:
+    bgr24 — (h, w, 3); yuv420p/nv12 — (h * 3 / 2, w), плоскость Y, затем цветность.
+    """
+    if pix_fmt == PIX_FMT_BGR:
+        return (height, width, 3)
+    return (height * 3 // 2, width)
+
+
+def image_shape(frame, pix_fmt=PIX_FMT_BGR):
+    """(h, w) изображения по буферу кадра."""
+    if pix_fmt == PIX_FMT_BGR:
+        return frame.shape[:2]
+    return frame.shape[0] * 2 // 3, frame.shape[1]
+
+
+def planes(frame, pix_fmt):
+    """
+    Плоскости YUV 4:2:0 как представления буфера без копирования:
+    yuv420p — (Y, U, V), nv12 — (Y, UV) с UV формы (h / 2, w / 2, 2).
+    """
+    h, w = image_shape(frame, pix_fmt)
+    y = frame[:h]
+    chroma = frame[h:].reshape(-1)
+    if pix_fmt == PIX_FMT_NV12:
+        return y, chroma.reshape(h // 2, w // 2, 2)
+    q = h * w // 4
+    return y, chroma[:q].reshape(h // 2, w // 2), chroma[q:].reshape(h // 2, w // 2)
+
+
+def to_bgr(frame, pix_fmt, roi=None):
+    """
+    BGR-изображение кадра или только области roi=(x1, y1, x2, y2): цветность
+    пересчитывается лишь для неё. Границы области выравниваются до чётных
+    (под субдискретизацию 4:2:0). Возвращает (bgr, (x1, y1)) — смещение области.
+    """
+    if pix_fmt == PIX_FMT_BGR:
+        if roi is None:
+            return frame, (0, 0)
+        h, w = frame.shape[:2]
+        x1, y1 = max(0, roi[0]), max(0, roi[1])
+        return frame[y1 : min(h, roi[3]), x1 : min(w, roi[2])], (x1, y1)
+
+    code = _TO_BGR[pix_fmt]
+    if roi is None:
+        return cv2.cvtColor(frame, code), (0, 0)
+
+    h, w = image_shape(frame, pix_fmt)
+    x1, y1 = max(0, roi[0]) & ~1, max(0, roi[1]) & ~1
+    x2, y2 = min(w, roi[2] + (roi[2] & 1)), min(h, roi[3] + (roi[3] & 1))
+    ch, cw = y2 - y1, x2 - x1
+
+    # Вырезка в том же формате: Y области, затем её цветность
+    crop = np.empty((ch * 3 // 2, cw), dtype=np.uint8)
+    flat = crop.reshape(-1)
+    src = planes(frame, pix_fmt)
+    flat[: ch * cw] = src[0][y1:y2, x1:x2].reshape(-1)
+    offset = ch * cw
+    for plane in src[1:]:
+        part = plane[y1 // 2 : y2 // 2, x1 // 2 : x2 // 2].reshape(-1)
+        flat[offset : offset + part.size] = part
+        offset += part.size
+    return cv2.cvtColor(crop, code), (x1, y1)
+
+
+def from_bgr(image, pix_fmt):
+    """BGR -> буфер в pix_fmt (для тестовых источников и бенчмарка)."""
+    if pix_fmt == PIX_FMT_BGR:
+        return image
+    i420 = cv2.cvtColor(image, cv2.COLOR_BGR2YUV_I420)
+    if pix_fmt == PIX_FMT_I420:
+        return i420
+    h, w = image.shape[:2]
+    out = np.empty_like(i420)
+    y, uv = planes(out, PIX_FMT_NV12)
+    src = planes(i420, PIX_FMT_I420)
+    y[:] = src[0]
+    uv[..., 0] = src[1]
+    uv[..., 1] = src[2]
+    return out
+
+
+@lru_cache(maxsize=64)
+def yuv_color(bgr):
+    """Цвет BGR -> (Y, U, V) в тех же коэффициентах, что и конвертация OpenCV."""
+    patch = np.empty((2, 2, 3), dtype=np.uint8)
+    patch[:] = bgr
+    yuv = cv2.cvtColor(patch, cv2.COLOR_BGR2YUV_I420).reshape(-1)
+    return int(yuv[0]), int(yuv[4]), int(yuv[5])
+
+
+def _uv16(bgr):
+    """Пара (U, V) цвета как uint16 в порядке байт плоскости NV12."""
+    _, u, v = yuv_color(bgr)
+    return int(np.array([u, v], dtype=np.uint8).view(np.uint16)[0])
+
+
+class Painter:
+    """
+    Примитивы OpenCV для кадра в любом из PIX_FMTS.
+
+    В bgr24 — обычное рисование. В YUV 4:2:0 каждый примитив рисуется
+    в плоскость яркости и с половинным масштабом в плоскости цветности,
+    без конвертации кадра в BGR и обратно.
+    """
+
+    def __init__(self, frame, pix_fmt=PIX_FMT_BGR):
+        self.pix_fmt = pix_fmt
+        if pix_fmt == PIX_FMT_BGR:
+            self._targets = [(frame, 1.0, None)]
+            return
+
+        y, *chroma = planes(frame, pix_fmt)
+        self._targets = [(y, 1.0, 0)]
+        if pix_fmt == PIX_FMT_NV12:
+            # OpenCV не рисует в 2-канальные изображения: пара байт U, V
+            # рисуется как одно 16-битное значение
+            self._targets.append((chroma[0].view(np.uint16)[..., 0], 0.5, "uv"))
+        else:
+            self._targets += [(chroma[0], 0.5, 1), (chroma[1], 0.5, 2)]
+
+    def _each(self, color):
+        for target, scale, component in self._targets:
+            if component is None:
+                yield target, scale, color
+            elif component == "uv":
+                yield target, scale, _uv16(tuple(color))
+            else:
+                yield target, scale, yuv_color(tuple(color))[component]
+
+    @staticmethod
+    def _pt(p, scale):
+        return (round(p[0] * scale), round(p[1] * scale))
+
+    @staticmethod
+    def _thickness(thickness, scale):
+        return thickness if thickness < 0 else max(1, round(thickness * scale))
+
+    def circle(self, center, radius, color, thickness=1):
+        for img, s, c in self._each(color):
+            r = max(1, round(radius * s))
+            cv2.circle(img, self._pt(center, s), r, c, self._thickness(thickness, s))
+
+    def rectangle(self, p1, p2, color, thickness=1):
+        for img, s, c in self._each(color):
+            cv2.rectangle(
+                img, self._pt(p1, s), self._pt(p2, s), c, self._thickness(thickness, s)
+            )
+
+    def polylines(self, pts, closed, color, thickness=1):
+        for img, s, c in self._each(color):
+            scaled = [np.round(np.asarray(p) * s).astype(np.int32) for p in pts]
+            cv2.polylines(img, scaled, closed, c, self._thickness(thickness, s))
+
+    def put_text(self, text, org, font_scale, color, thickness=1):
+        font = cv2.FONT_HERSHEY_SIMPLEX
+        for img, s, c in self._each(color):
+            x, y = self._pt(org, s)
+            scale, t = font_scale * s, self._thickness(thickness, s)
+            if img.dtype == np.uint8:
+                cv2.putText(img, text, (x, y), font, scale, c, t)
+                continue
+
+            # putText рисует только в 8 бит: текст по маске в пределах его рамки
+            (tw, th), base = cv2.getTextSize(text, font, scale, t)
+            x1, y1 = max(0, x - t), max(0, y - th - t)
+            x2, y2 = min(img.shape[1], x + tw + t), min(img.shape[0], y + base + t)
+            if x1 >= x2 or y1 >= y2:
+                continue
+            mask = np.zeros((y2 - y1, x2 - x1), dtype=np.uint8)
+            cv2.putText(mask, text, (x - x1, y - y1), font, scale, 255, t)
+            img[y1:y2, x1:x2][mask > 0] = c
@@ -1,6 +1,8 @@
+import asyncio
+from collections import OrderedDict
 from typing import Annotated
 
-from fastapi import APIRouter, Depends, Request, Response, status
+from fastapi import APIRouter, Depends, Path, Query, Request, Response, status
 
 from api.dependencies import get_match_service
 from core.schemas.session import CreateSession, GetSessionResponse, GetStatsResponse
@@ -71,9 +73,46 @@ async def complete_session(
 ): ...
 
 
+# Последний применённый номер события от каждого источника (запуска CV-сервиса):
+# повтор запроса после таймаута не начисляет очко второй раз. Каждый запуск CV —
+# новый источник, поэтому хранятся только MAX_SOURCES последних
+MAX_SOURCES = 32
+applied_seq: OrderedDict[str, int] = OrderedDict()
+# Запросы одного источника применяются по очереди: повтор, пришедший, пока
+# исходный запрос ещё начисляет очки, видит уже обновлённый applied_seq
+source_locks: dict[str, asyncio.Lock] = {}
+
+
+def get_source_lock(source: str) -> asyncio.Lock:
+    if source not in applied_seq:
+        applied_seq[source] = 0
+        source_locks[source] = asyncio.Lock()
+        while len(applied_seq) > MAX_SOURCES:
+            oldest, _ = applied_seq.popitem(last=False)
+            source_locks.pop(oldest, None)
+    applied_seq.move_to_end(source)
+    return source_locks[source]
+
+
 @router.post("/update/{player}")
 async def update(
     service: Annotated[MatchService, Depends(get_match_service)],
-    player: int,
-): 
-    await service.update(player)
+    player: int = Path(ge=1, le=2),
+    seq: int | None = Query(None, ge=0),
+    count: int = Query(1, ge=1, le=50),
+    source: str = Query("", max_length=64),
+):
+    """
+    Начислить count очков игроку. CV-сервис передаёт seq — номер последнего
+    из этих очков в своей нумерации source; уже применённые номера пропускаются.
+    """
+    if seq is None:
+        for _ in range(count):
+            await service.update(player)
+        return
+
+    async with get_source_lock(source):
+        first = max(seq - count + 1, applied_seq.get(source, 0) + 1)
+        for n in range(first, seq + 1):
+            await service.update(player)
+            applied_seq[source] = n
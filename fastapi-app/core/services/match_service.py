@@ -322,11 +322,11 @@ class MatchService:
     async def update(self, player: int):
         match = await self.repo.get_active_match()
         if not match:
-            raise
+            raise NotFoundError("No active match")
 
         last_set = await self.repo.get_last_set_of_match(match.id)
         if not last_set:
-            raise
+            raise NotFoundError(f"No set in progress for match {match.id}")
 
         # 1. Начисляем очко
         if player == 1: